@@ -51,18 +51,31 @@ FastAPI endpoints cho chatbot
 """
 
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List
 import json
 
-from app.services.rag_service import RAGService
 from app.models.conversation import ChatRequest, ChatResponse
+from app.services import rag_provider
 
 router = APIRouter(tags=["chat"])
 
-# Initialize RAG service
-rag_service = RAGService()
+def get_rag_service():
+    """
+    Dependency: RAGService đã warm-up (được dựng trong lifespan của app)
+    """
+    service = rag_provider.get_rag_service()
+    if service is None:
+        raise HTTPException(status_code=503, detail="Service is warming up")
+    return service
+
+def get_conversation_service():
+    """
+    Dependency: ConversationService chỉ cần database, không phải chờ
+    RAGService warm-up
+    """
+    return rag_provider.get_conversation_service()
 
 # ============================================================================
 # REQUEST/RESPONSE MODELS
@@ -73,8 +86,13 @@ class ProductSearchRequest(BaseModel):
     category: Optional[str] = None
     min_price: Optional[float] = None
     max_price: Optional[float] = None
+    in_stock: Optional[bool] = None
+    min_rating: Optional[float] = Field(default=None, ge=0, le=5)
     limit: int = Field(default=10, ge=1, le=50)
 
+class ProductBatchSearchRequest(BaseModel):
+    queries: List[ProductSearchRequest] = Field(..., min_length=1, max_length=100)
+
 class ConversationListRequest(BaseModel):
     user_id: int
     limit: int = Field(default=20, ge=1, le=100)
@@ -84,7 +102,7 @@ class ConversationListRequest(BaseModel):
 # ============================================================================
 
 @router.post("/chat-bot", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, rag_service=Depends(get_rag_service)):
     """
     Main chat endpoint - xử lý tin nhắn và trả về response
     
@@ -108,7 +126,7 @@ async def chat(request: ChatRequest):
     }
     """
     try:
-        result = rag_service.chat(
+        result = await rag_service.achat(
             user_id=request.user_id,
             message=request.message,
             conversation_id=request.conversation_id,
@@ -118,7 +136,7 @@ async def chat(request: ChatRequest):
         return ChatResponse(
             conversation_id=result["conversation_id"],
             message=result["assistant_message"],
-            retrieved_context=result["retrieved_context"]
+            retrieved_context=[hit.to_dict() for hit in result["retrieved_context"]]
         )
         
     except ValueError as e:
@@ -128,7 +146,7 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/chat-bot/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, rag_service=Depends(get_rag_service)):
     """
     Streaming chat endpoint - trả về response theo chunks (real-time)
     
@@ -140,7 +158,7 @@ async def chat_stream(request: ChatRequest):
     """
     try:
         async def event_generator():
-            for chunk in rag_service.stream_chat(
+            async for chunk in rag_service.astream_chat(
                 user_id=request.user_id,
                 message=request.message,
                 conversation_id=request.conversation_id,
@@ -158,7 +176,11 @@ async def chat_stream(request: ChatRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: int, user_id: int):
+async def get_conversation(
+    conversation_id: int,
+    user_id: int,
+    conversation_service=Depends(get_conversation_service)
+):
     """
     Lấy chi tiết conversation kèm messages
     
@@ -180,7 +202,7 @@ async def get_conversation(conversation_id: int, user_id: int):
     }
     """
     try:
-        result = rag_service.get_conversation_history(
+        result = conversation_service.get_conversation_history(
             conversation_id=conversation_id,
             user_id=user_id
         )
@@ -200,7 +222,10 @@ async def get_conversation(conversation_id: int, user_id: int):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/conversations/list")
-async def list_conversations(request: ConversationListRequest):
+async def list_conversations(
+    request: ConversationListRequest,
+    conversation_service=Depends(get_conversation_service)
+):
     """
     Lấy danh sách conversations của user
     
@@ -222,7 +247,7 @@ async def list_conversations(request: ConversationListRequest):
     ]
     """
     try:
-        conversations = rag_service.get_user_conversations(
+        conversations = conversation_service.list_user_conversations(
             user_id=request.user_id,
             limit=request.limit
         )
@@ -234,7 +259,10 @@ async def list_conversations(request: ConversationListRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/search/products")
-async def search_products(request: ProductSearchRequest):
+async def search_products(
+    request: ProductSearchRequest,
+    rag_service=Depends(get_rag_service)
+):
     """
     Search sản phẩm với filters
     
@@ -244,6 +272,8 @@ async def search_products(request: ProductSearchRequest):
         "category": "Áo thun",  // optional
         "min_price": 100000,    // optional
         "max_price": 500000,    // optional
+        "in_stock": true,       // optional - chỉ lấy sản phẩm còn hàng
+        "min_rating": 4.0,      // optional
         "limit": 10
     }
     
@@ -265,20 +295,70 @@ async def search_products(request: ProductSearchRequest):
     ]
     """
     try:
-        results = rag_service.search_products(
+        results = await rag_service.asearch_products(
             query=request.query,
             category=request.category,
             min_price=request.min_price,
             max_price=request.max_price,
-            n_results=request.limit
+            n_results=request.limit,
+            in_stock=request.in_stock,
+            min_rating=request.min_rating
         )
         
-        return results
+        return [hit.to_dict() for hit in results]
         
     except Exception as e:
         print(f"❌ Error searching products: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/search/products/batch")
+async def search_products_batch(
+    request: ProductBatchSearchRequest,
+    rag_service=Depends(get_rag_service)
+):
+    """
+    Search sản phẩm cho nhiều query trong một request
+
+    Các query được encode chung một batch và lookup cùng nhau.
+    
+    Request body:
+    {
+        "queries": [
+            {"query": "áo thun nam", "max_price": 300000, "limit": 5},
+            {"query": "quần jean", "in_stock": true}
+        ]
+    }
+    
+    Response: danh sách kết quả (cùng format /search/products) theo đúng
+    thứ tự queries
+    """
+    try:
+        results = await rag_service.asearch_products_batch([
+            {
+                "query": item.query,
+                "category": item.category,
+                "min_price": item.min_price,
+                "max_price": item.max_price,
+                "n_results": item.limit,
+                "in_stock": item.in_stock,
+                "min_rating": item.min_rating
+            }
+            for item in request.queries
+        ])
+        
+        return [[hit.to_dict() for hit in hits] for hits in results]
+        
+    except Exception as e:
+        print(f"❌ Error in batch product search: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/search/stats")
+async def search_stats(rag_service=Depends(get_rag_service)):
+    """
+    Thống kê runtime của search (cache embedding: hits/misses/evictions...)
+    """
+    return rag_service.search_service.get_stats()
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -287,29 +367,41 @@ async def health_check():
         "service": "RAG Chatbot API"
     }
 
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 khi encoder và indexes đã warm-up, ngược lại 503
+    """
+    state = rag_provider.readiness()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content=state)
+    return state
+
 # ============================================================================
 # ADMIN ENDPOINTS (Optional - for testing/debugging)
 # ============================================================================
 
 @router.get("/admin/collections/stats")
-async def get_collection_stats():
+async def get_collection_stats(rag_service=Depends(get_rag_service)):
     """
     Lấy thống kê về các ChromaDB collections
     (Chỉ dùng cho admin/testing)
     """
     try:
         stats = rag_service.search_service.collections_config
+        # Đọc một generation để số liệu nhất quán khi đang hot reload
+        generation = rag_service.search_service.generation
         
         collection_stats = {}
         for key, config in stats.items():
             try:
-                collection = rag_service.search_service.collections.get(key)
-                if collection:
+                # Collection có thể được phục vụ từ snapshot (không có Chroma handle)
+                if key in generation.collections:
                     collection_stats[key] = {
-                        "name": config["name"],
+                        "name": generation.collection_names.get(key, config["name"]),
                         "description": config["description"],
                         "weight": config["weight"],
-                        "count": collection.count()
+                        "count": generation.collection_sizes.get(key, 0)
                     }
             except:
                 collection_stats[key] = {
@@ -0,0 +1,132 @@
+"""
+Manifest alias -> tên collection thật (có version) trong Chroma
+
+Builder ghi vào collection mới có version ("{base}_v{time_ns}") rồi mới
+publish alias trong manifest, nên API không bao giờ thấy collection trống
+hay đang ghi dở. Collection cũ được đưa vào danh sách "retired" và chỉ bị
+xóa sau COLLECTION_GC_GRACE giây, đủ để mọi worker chuyển sang bản mới và
+các request đang chạy trên bản cũ kết thúc.
+
+Manifest được ghi atomic (file tạm + os.replace) dưới file lock.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from app.core.config import settings
+
+MANIFEST_FILE = "collections_manifest.json"
+
+def _manifest_path() -> str:
+    return os.path.join(settings.CHROMA_PATH or ".", MANIFEST_FILE)
+
+@contextmanager
+def _manifest_lock():
+    """Khóa giữa các process builder (không có fcntl thì bỏ qua)"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    with open(f"{_manifest_path()}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_manifest() -> Dict:
+    try:
+        with open(_manifest_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": "0", "collections": {}, "retired": []}
+    except Exception as e:
+        print(f"⚠️ Không thể đọc collections manifest: {e}")
+        return {"version": "0", "collections": {}, "retired": []}
+
+def _write_manifest(manifest: Dict):
+    path = _manifest_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def read_manifest_version() -> str:
+    return str(read_manifest().get("version", "0"))
+
+def base_collection_name(key: str) -> str:
+    return f"{settings.CHROMA_COLLECTION}_{key}"
+
+def versioned_collection_name(key: str) -> str:
+    return f"{base_collection_name(key)}_v{time.time_ns()}"
+
+def resolve_collection_name(key: str, manifest: Dict = None) -> str:
+    """Tên collection đang được publish cho alias (mặc định: tên cố định cũ)"""
+    manifest = manifest if manifest is not None else read_manifest()
+    return manifest.get("collections", {}).get(key, base_collection_name(key))
+
+def _collection_exists(client, name: str) -> bool:
+    try:
+        client.get_collection(name)
+        return True
+    except Exception:
+        return False
+
+def publish_collection(key: str, name: str, client=None) -> str:
+    """
+    Trỏ alias key sang collection name và tăng version của manifest
+
+    Publish lại đúng tên đang dùng (sync incremental) vẫn tăng version để
+    các worker nạp lại dữ liệu in-memory. Lần publish đầu của key: collection
+    tên cố định cũ (trước khi có manifest) cũng được retire nếu còn tồn tại
+    (cần client để kiểm tra).
+    """
+    with _manifest_lock():
+        manifest = read_manifest()
+        previous = manifest.get("collections", {}).get(key)
+        if previous is None and client is not None:
+            base = base_collection_name(key)
+            if _collection_exists(client, base):
+                previous = base
+        manifest.setdefault("collections", {})[key] = name
+        manifest.setdefault("retired", [])
+        if previous and previous != name:
+            manifest["retired"].append({"name": previous, "retired_at": time.time()})
+        manifest["version"] = str(time.time_ns())
+        _write_manifest(manifest)
+    print(f"🔀 Publish collection {key} -> {name}")
+    return manifest["version"]
+
+def gc_retired_collections(client, grace_seconds: float = None) -> int:
+    """Xóa các collection đã retired quá grace period, trả về số đã xóa"""
+    grace_seconds = settings.COLLECTION_GC_GRACE if grace_seconds is None else grace_seconds
+    now = time.time()
+
+    with _manifest_lock():
+        manifest = read_manifest()
+        retired = manifest.get("retired", [])
+        in_use = set(manifest.get("collections", {}).values())
+        keep, deleted = [], 0
+        for entry in retired:
+            if entry["name"] in in_use:
+                continue
+            if now - entry["retired_at"] < grace_seconds:
+                keep.append(entry)
+                continue
+            try:
+                client.delete_collection(entry["name"])
+                print(f"🗑️ Đã xóa collection cũ: {entry['name']}")
+            except Exception as e:
+                print(f"⚠️ Không thể xóa collection {entry['name']}: {e}")
+            deleted += 1
+
+        if len(keep) != len(retired):
+            manifest["retired"] = keep
+            _write_manifest(manifest)
+
+    return deleted
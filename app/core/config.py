@@ -20,4 +20,105 @@ class Settings:
 
     DEFAULT_FETCH_N = int(os.getenv("DEFAULT_FETCH_N", 5))
 
+    # Cache embedding của query (LRU + TTL)
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 2048))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 3600))
+
+    # Backend query encoder: torch | onnx | onnx-int8 (0 = giữ mặc định)
+    ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch").lower()
+    ENCODER_MAX_SEQ_LENGTH = int(os.getenv("ENCODER_MAX_SEQ_LENGTH", 0))
+    ENCODER_NUM_THREADS = int(os.getenv("ENCODER_NUM_THREADS", 0))
+    ENCODER_EXPORT_DIR = os.getenv("ENCODER_EXPORT_DIR", "app/data/encoder_onnx")
+    ENCODER_QUANTIZATION = os.getenv("ENCODER_QUANTIZATION", "avx2")
+
+    # Cập nhật collections khi build: "incremental" (chỉ encode document đổi
+    # theo content hash) | "rebuild" (encode lại toàn bộ vào collection mới
+    # có version rồi mới publish). Incremental ghi TẠI CHỖ khi tỉ lệ thay đổi
+    # <= SYNC_COPY_THRESHOLD: nhanh (tỉ lệ với phần đổi) nhưng request đang
+    # chạy có thể thấy collection cập nhật dở, không cô lập như versioned
+    # collection. Đổi nhiều hơn thì copy-on-write sang collection mới
+    SYNC_MODE = os.getenv("SYNC_MODE", "incremental").lower()
+    SYNC_COPY_THRESHOLD = float(os.getenv("SYNC_COPY_THRESHOLD", 0.3))
+
+    # Hot reload khi collections manifest đổi version: chu kỳ kiểm tra (giây)
+    # và thời gian giữ collection cũ trước khi xóa (giây)
+    COLLECTION_RELOAD_INTERVAL = float(os.getenv("COLLECTION_RELOAD_INTERVAL", 5))
+    COLLECTION_GC_GRACE = float(os.getenv("COLLECTION_GC_GRACE", 600))
+
+    # Cache embeddings trên đĩa cho các builder, key = (model, hash nội dung)
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "app/data/embedding_cache.sqlite3")
+
+    # Micro-batching cho query encoder
+    ENCODER_BATCHING = os.getenv("ENCODER_BATCHING", "true").lower() == "true"
+    ENCODER_MAX_BATCH_SIZE = int(os.getenv("ENCODER_MAX_BATCH_SIZE", 32))
+    ENCODER_MAX_WAIT_MS = float(os.getenv("ENCODER_MAX_WAIT_MS", 5))
+    # Thời gian tối đa một caller chờ batch chứa query của nó (ms)
+    ENCODER_TIMEOUT_MS = float(os.getenv("ENCODER_TIMEOUT_MS", 10000))
+
+    # Fan-out song song tới các collections (pool thực tế ít nhất
+    # ASYNC_SEARCH_WORKERS x số collections, xem SearchService)
+    SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", 8))
+    SEARCH_COLLECTION_TIMEOUT_MS = float(os.getenv("SEARCH_COLLECTION_TIMEOUT_MS", 1500))
+
+    # Executors cho async API (encode CPU-bound và query index tách riêng).
+    # Khi ENCODER_BATCHING bật, query đơn lẻ chờ batch encoder ngay trên
+    # event loop, encode workers chỉ dùng cho batch search / không batching
+    ASYNC_ENCODE_WORKERS = int(os.getenv("ASYNC_ENCODE_WORKERS", 4))
+    ASYNC_SEARCH_WORKERS = int(os.getenv("ASYNC_SEARCH_WORKERS", 8))
+
+    # Snapshot mmap dùng chung giữa các worker (faiss / matrix), "" = tắt.
+    # Matrix và collection flat của faiss tính điểm thẳng trên mmap; HNSW /
+    # IVF của faiss (collection > FAISS_FLAT_MAX_DOCS) vẫn là bản riêng
+    # của từng process
+    SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+
+    # Adaptive retrieval depth: depth ban đầu = n_results * weight * factor
+    ADAPTIVE_DEPTH_FACTOR = float(os.getenv("ADAPTIVE_DEPTH_FACTOR", 1.0))
+    ADAPTIVE_MIN_DEPTH = int(os.getenv("ADAPTIVE_MIN_DEPTH", 2))
+    ADAPTIVE_MAX_ROUNDS = int(os.getenv("ADAPTIVE_MAX_ROUNDS", 3))
+
+    # Vector engine: "chroma" | "faiss" | "matrix" (một ma trận cho mọi collection)
+    VECTOR_ENGINE = os.getenv("VECTOR_ENGINE", "chroma").lower()
+    FAISS_FLAT_MAX_DOCS = int(os.getenv("FAISS_FLAT_MAX_DOCS", 20000))
+    FAISS_LARGE_INDEX = os.getenv("FAISS_LARGE_INDEX", "hnsw").lower()  # "hnsw" | "ivf"
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+    FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+    FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", 16))
+
+    # Hybrid retrieval: BM25 trên chunk JSON + reciprocal-rank fusion
+    CHUNKS_DIR = os.getenv("CHUNKS_DIR", "app/data/json")
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+    BM25_K1 = float(os.getenv("BM25_K1", 1.5))
+    BM25_B = float(os.getenv("BM25_B", 0.75))
+    RRF_K = int(os.getenv("RRF_K", 60))
+
+    # Router intent/collection theo embedding prototypes
+    ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+    ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", 0.3))
+    ROUTER_INTENT_MARGIN = float(os.getenv("ROUTER_INTENT_MARGIN", 0.05))
+    ROUTER_COLLECTION_MARGIN = float(os.getenv("ROUTER_COLLECTION_MARGIN", 0.1))
+
+    # Semantic cache cho kết quả smart_search (opt-in): query chỉ khác màu
+    # hay chi tiết không nằm trong key (giá / size / danh mục / product
+    # terms) vẫn có thể có cosine >= threshold và dùng chung kết quả
+    SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "false").lower() == "true"
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1000))
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+    SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 600))
+
+    # Cross-encoder reranker (để trống RERANK_MODEL = tắt)
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+    RERANK_MAX_CANDIDATES = int(os.getenv("RERANK_MAX_CANDIDATES", 20))
+    RERANK_INTENTS = os.getenv("RERANK_INTENTS", "product_search,order_inquiry,support,general")
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 10000))
+    RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", 3600))
+
+    # Đa dạng hóa context: MMR + loại near-duplicate giữa các collections
+    DIVERSIFY = os.getenv("DIVERSIFY", "true").lower() == "true"
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))
+    # Số candidates đưa vào MMR = MMR_POOL_FACTOR x n_results, để có hit
+    # khác ý thế chỗ các near-duplicate bị loại
+    MMR_POOL_FACTOR = int(os.getenv("MMR_POOL_FACTOR", 3))
+    DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", 0.92))
+
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Cache embeddings trên đĩa cho các builder (sqlite)
+
+Key = (tên model, sha256 của text). Builder chỉ encode các text chưa từng
+thấy, phần còn lại đọc lại từ cache, nên chạy lại data_pipeline khi dữ
+liệu gần như không đổi không phải embed lại toàn bộ. Model chỉ được load
+khi thật sự có text cần encode.
+"""
+
+import hashlib
+import os
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Bảng (model, text_hash) -> vector float32"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        # Giới hạn số tham số của sqlite
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings "
+                f"WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *chunk]
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in items.items()
+                ]
+            )
+
+    def close(self):
+        self.conn.close()
+
+class CachedEncoder:
+    """
+    Encoder cho builder: cache theo nội dung + load model lazy
+
+    Đếm số document đã encode / dùng lại để builder báo cáo.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        cache_path: Optional[str] = None
+    ):
+        self.model_name = model_name or settings.MODEL_ENCODE
+        self.cache = EmbeddingCache(cache_path or settings.EMBEDDING_CACHE_PATH)
+        self._model = None
+        self.encoded = 0
+        self.reused = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            print("📦 Đang load embedding model...")
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False
+    ) -> np.ndarray:
+        """Embeddings đã normalize (float32), cùng thứ tự với texts"""
+        hashes = [text_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_name, hashes)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.model.encode(
+                list(missing.values()),
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=show_progress_bar,
+                normalize_embeddings=True
+            ).astype(np.float32)
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            cached.update(fresh)
+
+        self.encoded += len(missing)
+        self.reused += len(texts) - len(missing)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([cached[key] for key in hashes])
+
+    def report(self, label: str):
+        print(f"🧮 {label}: encode {self.encoded}, dùng lại từ cache {self.reused}")
+
+    def close(self):
+        self.cache.close()
@@ -1,6 +1,7 @@
 from typing import List, Dict, Optional
 from groq import Groq
 from app.core.config import settings
+from app.models.search_hit import SearchHit
 
 class GroqClient:
     def __init__(self):
@@ -10,7 +11,7 @@ class GroqClient:
     def generate_response(
         self,
         user_message: str,
-        context: List[Dict],
+        context: List[SearchHit],
         conversation_history: Optional[List[Dict]] = None,
         system_prompt: Optional[str] = None,
     ) -> str:
@@ -78,7 +79,7 @@ LƯU Ý QUAN TRỌNG:
     def generate_stream_response(
         self,
         user_message: str,
-        context: List[Dict],
+        context: List[SearchHit],
         conversation_history: Optional[List[Dict]] = None,
         system_prompt: Optional[str] = None,
     ):
@@ -138,14 +139,14 @@ Hãy trả lời câu hỏi của khách hàng dựa trên context được cung
             print(f"❌ Error streaming Groq response: {e}")
             yield "Xin lỗi, tôi đang gặp sự cố kỹ thuật."
 
-    def _build_context_text(self, context: List[Dict]) -> str:
+    def _build_context_text(self, context: List[SearchHit]) -> str:
         if not context:
             return "Không có thông tin liên quan."
 
         # Group by collection type
         grouped = {}
         for doc in context:
-            collection = doc.get("collection", "unknown")
+            collection = doc.collection or "unknown"
             if collection not in grouped:
                 grouped[collection] = []
             grouped[collection].append(doc)
@@ -155,8 +156,8 @@ Hãy trả lời câu hỏi của khách hàng dựa trên context được cung
         if "products" in grouped:
             context_parts.append("=== THÔNG TIN SẢN PHẨM ===")
             for i, doc in enumerate(grouped["products"], 1):
-                score = doc.get("weighted_score", 0)
-                text = doc.get("text", "")
+                score = doc.weighted_score
+                text = doc.text or ""
                 context_parts.append(f"\nSản phẩm {i} (Độ liên quan: {score:.2f}):\n{text}")
             context_parts.append("\n")
         
@@ -164,7 +165,7 @@ Hãy trả lời câu hỏi của khách hàng dựa trên context được cung
         if "categories" in grouped:
             context_parts.append("=== DANH MỤC SẢN PHẨM ===")
             for i, doc in enumerate(grouped["categories"], 1):
-                text = doc.get("text", "")
+                text = doc.text or ""
                 context_parts.append(f"\n{text}")
             context_parts.append("\n")
         
@@ -172,7 +173,7 @@ Hãy trả lời câu hỏi của khách hàng dựa trên context được cung
         if "faqs" in grouped:
             context_parts.append("=== CÂU HỎI THƯỜNG GẶP ===")
             for i, doc in enumerate(grouped["faqs"], 1):
-                text = doc.get("text", "")
+                text = doc.text or ""
                 context_parts.append(f"\n{text}")
             context_parts.append("\n")
         
@@ -180,7 +181,7 @@ Hãy trả lời câu hỏi của khách hàng dựa trên context được cung
         if "policies" in grouped:
             context_parts.append("=== CHÍNH SÁCH ===")
             for i, doc in enumerate(grouped["policies"], 1):
-                text = doc.get("text", "")
+                text = doc.text or ""
                 context_parts.append(f"\n{text}")
             context_parts.append("\n")
         
@@ -188,7 +189,7 @@ Hãy trả lời câu hỏi của khách hàng dựa trên context được cung
         if "order_guides" in grouped:
             context_parts.append("=== HƯỚNG DẪN ĐƠN HÀNG ===")
             for i, doc in enumerate(grouped["order_guides"], 1):
-                text = doc.get("text", "")
+                text = doc.text or ""
                 context_parts.append(f"\n{text}")
             context_parts.append("\n")
 
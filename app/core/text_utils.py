@@ -0,0 +1,51 @@
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Từ phổ biến không mang thông tin cho lexical search
+VIETNAMESE_STOPWORDS = {
+    "và", "là", "của", "có", "không", "cho", "các", "những", "được", "này",
+    "thì", "mà", "với", "để", "từ", "trong", "khi", "nào", "gì", "tôi",
+    "bạn", "shop", "ạ", "ơi", "nhé", "ko", "k", "a", "à", "vậy", "hay",
+}
+
+def clean_text(text: str) -> str:
+    return " ".join(text.split()).strip() if text else ""
+
+def normalize_query(text: str) -> str:
+    """
+    Chuẩn hóa query làm cache key: Unicode NFC + gộp whitespace + lowercase
+    """
+    return unicodedata.normalize("NFC", clean_text(text)).lower()
+
+def fold_diacritics(text: str) -> str:
+    """
+    Bỏ dấu tiếng Việt: "áo thun đỏ" -> "ao thun do"
+    """
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    return unicodedata.normalize("NFC", stripped.replace("đ", "d").replace("Đ", "D"))
+
+def has_diacritics(text: str) -> bool:
+    return fold_diacritics(text) != text
+
+def tokenize(text: str, fold: bool = False) -> List[str]:
+    """
+    Tokenize tiếng Việt cho lexical search
+
+    Tiếng Việt viết theo âm tiết, từ thường gồm 2 âm tiết ("áo thun",
+    "sơ mi", "đổi trả") nên trả về cả unigram (bỏ stopwords) lẫn bigram
+    của các âm tiết liền nhau.
+    """
+    syllables = _TOKEN_RE.findall(normalize_query(text))
+    if fold:
+        stopwords = {fold_diacritics(w) for w in VIETNAMESE_STOPWORDS}
+        syllables = [fold_diacritics(s) for s in syllables]
+    else:
+        stopwords = VIETNAMESE_STOPWORDS
+
+    tokens = [s for s in syllables if s not in stopwords]
+    tokens.extend(f"{a}_{b}" for a, b in zip(syllables, syllables[1:]))
+    return tokens
@@ -0,0 +1,233 @@
+"""
+Ghi một Chroma collection từ danh sách documents mới
+
+- sync_collection (incremental): so sánh id + content_hash với collection
+  đang publish và chỉ encode (qua CachedEncoder) document mới / đổi nội
+  dung. Thay đổi nhỏ (<= SYNC_COPY_THRESHOLD) được ghi TẠI CHỖ: ghi lại
+  các id đổi, xóa id không còn (ví dụ sản phẩm ngừng bán) rồi tăng version
+  manifest - thời gian tỉ lệ với phần thay đổi, không phải cả catalog.
+  Đổi nhiều hơn thì copy-on-write như rebuild (phần không đổi copy kèm
+  embedding). Không có gì đổi thì không ghi gì.
+- rebuild_collection: encode lại toàn bộ vào collection mới có version.
+
+Trade-off của đường tại chỗ (so với collection có version, xem
+app.core.collection_manifest): request đang chạy có thể thấy collection
+đang cập nhật dở, và lỗi giữa chừng để lại một phần thay đổi (chạy lại
+sync sẽ hoàn tất vì content_hash chưa khớp). Đường copy-on-write thì lỗi
+ở bất kỳ batch nào -> xóa collection mới, không publish, raise lại.
+
+content_hash (model encode + text + metadata) được lưu trong metadata của
+document, nên đổi model thì mọi document đều được encode lại.
+"""
+
+import json
+from typing import Callable, Dict, List
+
+import numpy as np
+from tqdm import tqdm
+
+from app.core.config import settings
+from app.core.collection_manifest import (
+    gc_retired_collections,
+    publish_collection,
+    resolve_collection_name,
+    versioned_collection_name
+)
+from app.core.embedding_cache import CachedEncoder, text_hash
+
+CONTENT_HASH_KEY = "content_hash"
+
+def content_hash(document: Dict, model_name: str = "") -> str:
+    metadata = {k: v for k, v in document["metadata"].items() if k != CONTENT_HASH_KEY}
+    payload = json.dumps(
+        [model_name, document["text"], metadata], ensure_ascii=False, sort_keys=True
+    )
+    return text_hash(payload)
+
+def _stamped(document: Dict, digest: str) -> Dict:
+    return {
+        "id": document["id"],
+        "text": document["text"],
+        "metadata": {**document["metadata"], CONTENT_HASH_KEY: digest}
+    }
+
+def _add_encoded(
+    collection,
+    documents: List[Dict],
+    encoder: CachedEncoder,
+    batch_size: int,
+    desc: str = ""
+):
+    batches = range(0, len(documents), batch_size)
+    if desc:
+        batches = tqdm(batches, desc=desc, total=(len(documents) + batch_size - 1) // batch_size)
+
+    for i in batches:
+        batch = documents[i:i + batch_size]
+        embeddings = encoder.encode([doc["text"] for doc in batch])
+        collection.add(
+            ids=[doc["id"] for doc in batch],
+            embeddings=embeddings.tolist(),
+            metadatas=[doc["metadata"] for doc in batch],
+            documents=[doc["text"] for doc in batch]
+        )
+
+def _copy_documents(source, target, ids: List[str], batch_size: int):
+    """Copy nguyên record (kèm embedding) từ collection cũ, không encode lại"""
+    for i in range(0, len(ids), batch_size):
+        records = source.get(
+            ids=ids[i:i + batch_size],
+            include=["embeddings", "metadatas", "documents"]
+        )
+        if not records["ids"]:
+            continue
+        target.add(
+            ids=records["ids"],
+            embeddings=np.asarray(records["embeddings"], dtype=np.float32).tolist(),
+            metadatas=records["metadatas"],
+            documents=records["documents"]
+        )
+
+def _replace_in_place(
+    collection,
+    changed: List[Dict],
+    updated_ids: List[str],
+    deleted_ids: List[str],
+    encoder: CachedEncoder,
+    batch_size: int
+):
+    """
+    Ghi thay đổi thẳng vào collection đang publish
+
+    Upsert của Chroma merge metadata (key cũ như size_<x> vẫn còn), nên id
+    đổi nội dung được xóa rồi add lại ngay sau khi đã encode xong batch.
+    """
+    updated = set(updated_ids)
+    for i in range(0, len(changed), batch_size):
+        batch = changed[i:i + batch_size]
+        embeddings = encoder.encode([doc["text"] for doc in batch])
+        stale = [doc["id"] for doc in batch if doc["id"] in updated]
+        if stale:
+            collection.delete(ids=stale)
+        collection.add(
+            ids=[doc["id"] for doc in batch],
+            embeddings=embeddings.tolist(),
+            metadatas=[doc["metadata"] for doc in batch],
+            documents=[doc["text"] for doc in batch]
+        )
+
+    for i in range(0, len(deleted_ids), batch_size):
+        collection.delete(ids=deleted_ids[i:i + batch_size])
+
+def write_versioned_collection(
+    client,
+    key: str,
+    fill: Callable,
+    description: str = ""
+) -> str:
+    """
+    Tạo collection mới có version, gọi fill(collection) để ghi dữ liệu rồi
+    publish; fill lỗi thì xóa collection mới và raise lại
+    """
+    name = versioned_collection_name(key)
+    collection = client.create_collection(
+        name=name,
+        metadata={"description": description} if description else None
+    )
+
+    try:
+        fill(collection)
+    except Exception:
+        try:
+            client.delete_collection(name)
+        except Exception as e:
+            print(f"⚠️ Không thể xóa collection ghi dở {name}: {e}")
+        raise
+
+    publish_collection(key, name, client)
+    gc_retired_collections(client)
+    return name
+
+def sync_collection(
+    client,
+    key: str,
+    documents: List[Dict],
+    encoder: CachedEncoder,
+    description: str = "",
+    batch_size: int = 64
+) -> Dict[str, int]:
+    """
+    Đưa collection của key về đúng tập documents, chỉ encode phần thay đổi
+
+    Returns: {"added", "updated", "deleted", "unchanged"}
+    """
+    live_name = resolve_collection_name(key)
+    try:
+        live = client.get_collection(live_name)
+        existing = live.get(include=["metadatas"])
+    except Exception:
+        live, existing = None, {"ids": [], "metadatas": []}
+
+    existing_hashes = {
+        doc_id: (metadata or {}).get(CONTENT_HASH_KEY)
+        for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+
+    stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    changed, unchanged_ids, updated_ids = [], [], []
+    for document in documents:
+        digest = content_hash(document, encoder.model_name)
+        old = existing_hashes.get(document["id"], False)
+        if old == digest:
+            stats["unchanged"] += 1
+            unchanged_ids.append(document["id"])
+            continue
+        if old is False:
+            stats["added"] += 1
+        else:
+            stats["updated"] += 1
+            updated_ids.append(document["id"])
+        changed.append(_stamped(document, digest))
+
+    new_ids = {document["id"] for document in documents}
+    deleted_ids = [doc_id for doc_id in existing_hashes if doc_id not in new_ids]
+    stats["deleted"] = len(deleted_ids)
+
+    n_changes = len(changed) + len(deleted_ids)
+    if live is not None and 0 < n_changes <= settings.SYNC_COPY_THRESHOLD * max(1, len(existing_hashes)):
+        _replace_in_place(live, changed, updated_ids, deleted_ids, encoder, batch_size)
+        # Cùng tên collection: chỉ tăng version để các worker nạp lại
+        publish_collection(key, live_name)
+    elif n_changes:
+        def fill(collection):
+            _copy_documents(live, collection, unchanged_ids, batch_size)
+            _add_encoded(collection, changed, encoder, batch_size)
+
+        live_name = write_versioned_collection(client, key, fill, description)
+
+    print(
+        f"🔁 Sync {live_name}: +{stats['added']} ~{stats['updated']} "
+        f"-{stats['deleted']} (giữ nguyên {stats['unchanged']})"
+    )
+    return stats
+
+def rebuild_collection(
+    client,
+    key: str,
+    documents: List[Dict],
+    encoder: CachedEncoder,
+    description: str = "",
+    batch_size: int = 64,
+    desc: str = ""
+) -> str:
+    """Encode lại toàn bộ documents vào collection mới, trả về tên collection"""
+    stamped = [
+        _stamped(document, content_hash(document, encoder.model_name))
+        for document in documents
+    ]
+    return write_versioned_collection(
+        client,
+        key,
+        lambda collection: _add_encoded(collection, stamped, encoder, batch_size, desc),
+        description
+    )
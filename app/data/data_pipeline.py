@@ -3,10 +3,12 @@ from app.data.category_data_builder import build_categories_embeddings
 from app.data.faq_data_builder import build_faq_embeddings
 from app.data.policy_data_builder import build_policy_embeddings
 from app.data.order_data_builder import build_order_guide_embeddings
+from app.data.snapshot_builder import build_snapshot
 
 if __name__ == "__main__":
     build_faq_embeddings()
     build_policy_embeddings()
     build_order_guide_embeddings()
     build_categories_embeddings()
-    build_products_embeddings()
\ No newline at end of file
+    build_products_embeddings()
+    build_snapshot()
\ No newline at end of file
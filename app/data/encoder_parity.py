@@ -0,0 +1,132 @@
+"""
+So sánh backend query encoder với torch trên corpus chunk JSON
+
+    python -m app.data.encoder_parity --backends onnx onnx-int8 --queries 200
+
+Báo cáo cosine drift (mean / p1 / min) giữa embeddings của từng backend và
+embeddings torch, cùng latency encode một query (p50 / p95) và throughput
+batch. Bản tham chiếu cosine là torch encode với độ dài đầy đủ của model,
+nên drift do ENCODER_MAX_SEQ_LENGTH cắt ngắn input cũng được tính vào.
+Latency của torch được đo với cùng ENCODER_MAX_SEQ_LENGTH như các backend
+ONNX để so sánh công bằng.
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.encoder import ENCODER_BACKENDS, load_encoder
+from app.services.lexical_index import load_chunk_documents
+
+def load_corpus() -> List[str]:
+    documents = load_chunk_documents(settings.CHUNKS_DIR)
+    return [doc["text"] for docs in documents.values() for doc in docs if doc.get("text")]
+
+def encode(model, texts: List[str], batch_size: int = 32) -> np.ndarray:
+    return model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    ).astype(np.float32)
+
+def measure_latency(model, queries: List[str]) -> Dict[str, float]:
+    # Warm-up để không tính thời gian khởi tạo session / graph
+    for query in queries[:5]:
+        encode(model, [query])
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        encode(model, [query])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    encode(model, queries)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "batch_per_sec": len(queries) / batch_seconds if batch_seconds else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"],
+                        choices=[b for b in ENCODER_BACKENDS if b != "torch"])
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Số chunk dùng để đo latency")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    if not corpus:
+        print(f"❌ Không có chunk nào trong {settings.CHUNKS_DIR}")
+        return
+    queries = corpus[:args.queries]
+    print(f"📚 Corpus: {len(corpus)} chunks, đo latency trên {len(queries)} chunks")
+
+    common = dict(
+        max_seq_length=settings.ENCODER_MAX_SEQ_LENGTH,
+        num_threads=settings.ENCODER_NUM_THREADS,
+        export_root=settings.ENCODER_EXPORT_DIR,
+        quantization=settings.ENCODER_QUANTIZATION
+    )
+
+    # Tham chiếu cosine: torch, không cắt max_seq_length
+    reference_model = load_encoder(
+        settings.MODEL_ENCODE, backend="torch", **{**common, "max_seq_length": 0}
+    )
+    reference = encode(reference_model, corpus)
+
+    # Latency torch: cùng max_seq_length với các backend ONNX
+    if settings.ENCODER_MAX_SEQ_LENGTH:
+        del reference_model
+        torch_model = load_encoder(settings.MODEL_ENCODE, backend="torch", **common)
+        cosine = np.einsum("ij,ij->i", reference, encode(torch_model, corpus))
+        report = {"torch": {
+            "cos_mean": float(cosine.mean()),
+            "cos_p1": float(np.percentile(cosine, 1)),
+            "cos_min": float(cosine.min()),
+            **measure_latency(torch_model, queries)
+        }}
+        del torch_model
+    else:
+        report = {"torch": measure_latency(reference_model, queries)}
+        del reference_model
+
+    for backend in args.backends:
+        model = load_encoder(settings.MODEL_ENCODE, backend=backend, **common)
+        if getattr(model, "backend", "torch") != "onnx":
+            print(f"❌ Backend {backend} đã fallback về torch (thiếu optimum / onnxruntime?), bỏ qua")
+            del model
+            continue
+        embeddings = encode(model, corpus)
+        # Cả hai đã normalize nên tích vô hướng từng hàng = cosine
+        cosine = np.einsum("ij,ij->i", reference, embeddings)
+        report[backend] = {
+            "cos_mean": float(cosine.mean()),
+            "cos_p1": float(np.percentile(cosine, 1)),
+            "cos_min": float(cosine.min()),
+            **measure_latency(model, queries)
+        }
+        del model
+
+    print(f"\n{'backend':<12}{'cos_mean':>10}{'cos_p1':>10}{'cos_min':>10}"
+          f"{'p50_ms':>10}{'p95_ms':>10}{'batch/s':>10}")
+    for backend, row in report.items():
+        print(
+            f"{backend:<12}"
+            f"{row.get('cos_mean', 1.0):>10.4f}"
+            f"{row.get('cos_p1', 1.0):>10.4f}"
+            f"{row.get('cos_min', 1.0):>10.4f}"
+            f"{row['p50_ms']:>10.2f}"
+            f"{row['p95_ms']:>10.2f}"
+            f"{row['batch_per_sec']:>10.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import json
 import chromadb
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
+from app.core.embedding_cache import CachedEncoder
+from app.data.collection_sync import rebuild_collection, sync_collection
 
 def get_faq_data():
     faqs = [
@@ -163,43 +164,34 @@ def embed_faqs_to_chroma(documents):
         return
     
     try:
-        print("📦 Đang load embedding model...")
-        model = SentenceTransformer(settings.MODEL_ENCODE)
+        # Chỉ encode text chưa có trong cache (model load khi cần)
+        encoder = CachedEncoder()
         
         print("🔗 Đang kết nối ChromaDB...")
         client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
         
-        collection_name = f"{settings.CHROMA_COLLECTION}_faqs"
-        
-        if collection_name in [c.name for c in client.list_collections()]:
-            client.delete_collection(collection_name)
-            print(f"🗑️ Đã xóa collection cũ: {collection_name}")
-        
-        collection = client.create_collection(
-            name=collection_name,
-            metadata={"description": "FAQ embeddings for e-commerce chatbot"}
-        )
-        
-        batch_texts = [doc["text"] for doc in documents]
-        batch_ids = [doc["id"] for doc in documents]
-        batch_metadata = [doc["metadata"] for doc in documents]
-        
-        print("🔄 Đang tạo embeddings...")
-        embeddings = model.encode(
-            batch_texts, 
-            convert_to_numpy=True, 
-            show_progress_bar=True,
-            normalize_embeddings=True
-        )
-        
-        collection.upsert(
-            ids=batch_ids,
-            embeddings=embeddings.tolist(),
-            metadatas=batch_metadata,
-            documents=batch_texts
-        )
-        
-        print(f"✅ Đã embed {len(documents)} FAQs vào ChromaDB")
+        # Cả hai chế độ ghi vào collection mới có version rồi mới publish,
+        # request đang chạy vẫn đọc collection cũ nguyên vẹn
+        if settings.SYNC_MODE == "incremental":
+            # Chỉ encode documents mới / thay đổi, phần còn lại copy sang
+            sync_collection(
+                client,
+                "faqs",
+                documents,
+                encoder,
+                description="FAQ embeddings for e-commerce chatbot"
+            )
+        else:
+            rebuild_collection(
+                client,
+                "faqs",
+                documents,
+                encoder,
+                description="FAQ embeddings for e-commerce chatbot",
+                desc="Embedding FAQs"
+            )
+            print(f"✅ Đã embed {len(documents)} FAQs vào ChromaDB")
+        encoder.report("FAQs")
         
     except Exception as e:
         print(f"❌ Lỗi khi embed vào ChromaDB: {e}")
@@ -1,7 +1,8 @@
 import json
 import chromadb
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
+from app.core.embedding_cache import CachedEncoder
+from app.data.collection_sync import rebuild_collection, sync_collection
 from typing import List, Dict
 
 def get_order_guide_data() -> List[Dict]:
@@ -231,39 +232,33 @@ def embed_guides_to_chroma(documents: List[Dict]):
         return
     
     try:
-        model = SentenceTransformer(settings.MODEL_ENCODE)
+        # Chỉ encode text chưa có trong cache (model load khi cần)
+        encoder = CachedEncoder()
         
         client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
         
-        collection_name = f"{settings.CHROMA_COLLECTION}_order_guides"
-        
-        if collection_name in [c.name for c in client.list_collections()]:
-            client.delete_collection(collection_name)
-        
-        collection = client.create_collection(
-            name=collection_name,
-            metadata={"description": "Order guide embeddings for e-commerce chatbot"}
-        )
-        
-        batch_texts = [doc["text"] for doc in documents]
-        batch_ids = [doc["id"] for doc in documents]
-        batch_metadata = [doc["metadata"] for doc in documents]
-        
-        embeddings = model.encode(
-            batch_texts, 
-            convert_to_numpy=True, 
-            show_progress_bar=True,
-            normalize_embeddings=True
-        )
-        
-        collection.upsert(
-            ids=batch_ids,
-            embeddings=embeddings.tolist(),
-            metadatas=batch_metadata,
-            documents=batch_texts
-        )
-        
-        print(f"✅ Đã embed {len(documents)} order guides vào ChromaDB")
+        # Cả hai chế độ ghi vào collection mới có version rồi mới publish,
+        # request đang chạy vẫn đọc collection cũ nguyên vẹn
+        if settings.SYNC_MODE == "incremental":
+            # Chỉ encode documents mới / thay đổi, phần còn lại copy sang
+            sync_collection(
+                client,
+                "order_guides",
+                documents,
+                encoder,
+                description="Order guide embeddings for e-commerce chatbot"
+            )
+        else:
+            rebuild_collection(
+                client,
+                "order_guides",
+                documents,
+                encoder,
+                description="Order guide embeddings for e-commerce chatbot",
+                desc="Embedding order guides"
+            )
+            print(f"✅ Đã embed {len(documents)} order guides vào ChromaDB")
+        encoder.report("order guides")
         
     except Exception as e:
         print(f"❌ Lỗi khi embed vào ChromaDB: {e}")
@@ -1,9 +1,10 @@
 from app.core.database import connectDB
 import json 
 import chromadb
-from tqdm import tqdm
 from app.core.config import settings
-from sentence_transformers import SentenceTransformer
+from app.core.embedding_cache import CachedEncoder
+from app.data.collection_sync import rebuild_collection, sync_collection
+from app.services.query_parser import size_metadata_key
 from typing import List, Dict
 
 def clean_text(text: str) -> str:
@@ -52,6 +53,14 @@ def build_product_text(product: dict) -> str:
     
     return clean_text(". ".join(parts) + ".")
 
+def build_size_flags(product: dict) -> dict:
+    """size_xl=True, ... cho các size còn hàng (filter theo size trong query)"""
+    return {
+        size_metadata_key(v["size"]): True
+        for v in product.get("variants", [])
+        if v.get("size") and v.get("quantity", 0) > 0
+    }
+
 def build_product_document(product: dict) -> dict:
     return {
         "id": f"product_{product['id']}",
@@ -67,7 +76,8 @@ def build_product_document(product: dict) -> dict:
             "review_count": product.get("review_count", 0),
             "total_stock": sum(v.get('quantity', 0) for v in product.get('variants', [])),
             "has_variants": len(product.get("variants", [])) > 0,
-            "image_count": product.get("image_count", 0)
+            "image_count": product.get("image_count", 0),
+            **build_size_flags(product)
         }
     }
 
@@ -192,51 +202,35 @@ def embed_products_to_chroma(documents: List[Dict]):
         return
     
     try:
-        model = SentenceTransformer(settings.MODEL_ENCODE)
+        # Chỉ encode text chưa có trong cache (model load khi cần)
+        encoder = CachedEncoder()
         
         client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
         
-        collection_name = f"{settings.CHROMA_COLLECTION}_products"
-        
-        if collection_name in [c.name for c in client.list_collections()]:
-            client.delete_collection(collection_name)
-        
-        collection = client.create_collection(
-            name=collection_name,
-            metadata={"description": "Product embeddings for e-commerce chatbot"}
-        )
-        
-        batch_size = 16
-        total_batches = (len(documents) + batch_size - 1) // batch_size
-        
-        for i in tqdm(range(0, len(documents), batch_size), 
-                     desc="Embedding products", 
-                     total=total_batches):
-            batch = documents[i:i+batch_size]
-            batch_texts = [doc["text"] for doc in batch]
-            batch_ids = [doc["id"] for doc in batch]
-            batch_metadata = [doc["metadata"] for doc in batch]
-            
-            try:
-                # Tạo embeddings
-                batch_embeddings = model.encode(
-                    batch_texts, 
-                    convert_to_numpy=True, 
-                    show_progress_bar=False,
-                    normalize_embeddings=True
-                )
-                
-                # Lưu vào ChromaDB
-                collection.upsert(
-                    ids=batch_ids,
-                    embeddings=batch_embeddings.tolist(),
-                    metadatas=batch_metadata,
-                    documents=batch_texts
-                )
-            except Exception as e:
-                print(f"⚠️ Lỗi khi xử lý batch {i // batch_size + 1}: {e}")
-        
-        print(f"✅ Đã embed {len(documents)} sản phẩm vào ChromaDB")
+        # Cả hai chế độ ghi vào collection mới có version rồi mới publish,
+        # request đang chạy vẫn đọc collection cũ nguyên vẹn
+        if settings.SYNC_MODE == "incremental":
+            # Chỉ encode documents mới / thay đổi, phần còn lại copy sang
+            sync_collection(
+                client,
+                "products",
+                documents,
+                encoder,
+                description="Product embeddings for e-commerce chatbot",
+                batch_size=16
+            )
+        else:
+            rebuild_collection(
+                client,
+                "products",
+                documents,
+                encoder,
+                description="Product embeddings for e-commerce chatbot",
+                batch_size=16,
+                desc="Embedding products"
+            )
+            print(f"✅ Đã embed {len(documents)} sản phẩm vào ChromaDB")
+        encoder.report("sản phẩm")
         
     except Exception as e:
         print(f"❌ Lỗi khi embed vào ChromaDB: {e}")
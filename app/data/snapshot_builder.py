@@ -0,0 +1,39 @@
+import chromadb
+from app.core.config import settings
+from app.core.collection_manifest import read_manifest, resolve_collection_name
+from app.services.snapshot import write_snapshot
+from app.services.vector_engine import load_collection_data
+
+# Cùng thứ tự với SearchService.collections_config, để matrix engine
+# dùng thẳng ma trận mmap mà không phải ghép lại
+SNAPSHOT_COLLECTIONS = ["products", "categories", "faqs", "policies", "order_guides"]
+
+def build_snapshot():
+    """Ghi snapshot mmap từ các Chroma collections vừa build"""
+    if not settings.SNAPSHOT_DIR:
+        print("⚠️ SNAPSHOT_DIR chưa được cấu hình, bỏ qua snapshot")
+        return
+    
+    try:
+        print("🔗 Đang kết nối ChromaDB...")
+        client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
+        existing = {c.name for c in client.list_collections()}
+        manifest = read_manifest()
+        
+        collections = {}
+        for key in SNAPSHOT_COLLECTIONS:
+            name = resolve_collection_name(key, manifest)
+            if name not in existing:
+                print(f"⚠️ Không có collection {name}, bỏ qua")
+                continue
+            collections[key] = load_collection_data(client.get_collection(name))
+        
+        path = write_snapshot(settings.SNAPSHOT_DIR, collections)
+        total = sum(len(data) for data in collections.values())
+        print(f"✅ Đã ghi snapshot {total} vectors vào {path}")
+        
+    except Exception as e:
+        print(f"❌ Lỗi khi ghi snapshot: {e}")
+
+if __name__ == "__main__":
+    build_snapshot()
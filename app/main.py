@@ -1,12 +1,36 @@
+from contextlib import asynccontextmanager
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.chat.chat_api import router as chat_router
+from app.services import rag_provider
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Dựng + warm-up RAGService ở thread riêng: port được bind ngay,
+    /api/ready chuyển sang true khi encoder và indexes đã sẵn sàng
+    """
+    startup = asyncio.create_task(asyncio.to_thread(rag_provider.build_rag_service))
+    startup.add_done_callback(_log_startup_failure)
+    yield
+    # Thread dựng không thể bị cancel: báo cho nó dừng ở bước kế tiếp
+    rag_provider.shutdown()
+
+def _log_startup_failure(task: asyncio.Task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        print(f"❌ Startup thất bại, /api/ready sẽ báo failed: {error!r}")
 
 # Initialize FastAPI app
 app = FastAPI(
     title="E-commerce RAG Chatbot API",
     description="RAG-powered chatbot cho cửa hàng thời trang",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
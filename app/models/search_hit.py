@@ -0,0 +1,65 @@
+from typing import Any, Dict, Optional
+
+class SearchHit:
+    """
+    Một kết quả retrieval, dùng xuyên suốt từ retrieval -> rerank -> build prompt
+
+    Dùng __slots__ thay cho dict để giảm allocation/bộ nhớ khi mỗi request
+    tạo hàng trăm candidates. Chỉ chuyển sang dict (to_dict) ở biên API.
+    """
+
+    __slots__ = (
+        "id", "collection", "text", "metadata", "distance",
+        "raw_score", "weighted_score", "lexical_score", "fused_score", "rerank_score"
+    )
+
+    def __init__(
+        self,
+        id: str,
+        collection: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        distance: Optional[float] = None,
+        text: Optional[str] = None,
+        raw_score: float = 0.0,
+        weighted_score: float = 0.0,
+        lexical_score: Optional[float] = None,
+        fused_score: Optional[float] = None,
+        rerank_score: Optional[float] = None
+    ):
+        self.id = id
+        self.collection = collection
+        self.metadata = metadata if metadata is not None else {}
+        self.distance = distance
+        self.text = text
+        self.raw_score = raw_score
+        self.weighted_score = weighted_score
+        self.lexical_score = lexical_score
+        self.fused_score = fused_score
+        self.rerank_score = rerank_score
+
+    def copy(self) -> "SearchHit":
+        hit = SearchHit.__new__(SearchHit)
+        for name in self.__slots__:
+            setattr(hit, name, getattr(self, name))
+        return hit
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Chuyển sang JSON-friendly dict (chỉ dùng ở biên API)"""
+        data = {
+            "id": self.id,
+            "text": self.text,
+            "metadata": self.metadata,
+            "distance": self.distance,
+            "collection": self.collection,
+            "weighted_score": self.weighted_score,
+            "raw_score": self.raw_score
+        }
+        for name in ("lexical_score", "fused_score", "rerank_score"):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+    def __repr__(self) -> str:
+        return (f"SearchHit(id={self.id!r}, collection={self.collection!r}, "
+                f"weighted_score={self.weighted_score:.4f})")
@@ -0,0 +1,61 @@
+"""
+Depth thích ứng cho retrieval nhiều collection
+
+Mỗi collection bắt đầu với số candidates nhỏ, tỉ lệ với trọng số của nó,
+và chỉ được lấy sâu hơn (gấp đôi) khi các document chưa lấy còn có thể
+lọt vào top-k sau merge.
+"""
+
+import math
+from typing import Dict, List
+
+from app.models.search_hit import SearchHit
+
+def initial_depth(
+    weight: float,
+    n_results: int,
+    size: int,
+    min_depth: int,
+    depth_factor: float
+) -> int:
+    """
+    Số candidates ban đầu cho một collection: tỉ lệ với trọng số
+    collection, không vượt quá kích thước collection (size = 0: chưa biết)
+    """
+    depth = max(min_depth, math.ceil(n_results * weight * depth_factor))
+    return min(depth, size) if size else depth
+
+def expand_depths(
+    completed: List[str],
+    hits_by_collection: Dict[str, List[SearchHit]],
+    depths: Dict[str, int],
+    n_results: int,
+    sizes: Dict[str, int]
+) -> List[str]:
+    """
+    Chọn các collections cần lấy sâu hơn ở vòng sau (cập nhật depths)
+
+    Hits của một collection được sắp theo điểm giảm dần, nên điểm của
+    hit cuối cùng là cận trên cho mọi document chưa lấy. Chỉ mở rộng
+    (gấp đôi depth) khi cận trên này còn vượt được điểm thứ k hiện tại.
+    """
+    scores = sorted(
+        (hit.weighted_score for hits in hits_by_collection.values() for hit in hits),
+        reverse=True
+    )
+    kth_best = scores[n_results - 1] if len(scores) >= n_results else -math.inf
+
+    expand = []
+    for coll_key in completed:
+        hits = hits_by_collection[coll_key]
+        size = sizes.get(coll_key, 0)
+        exhausted = len(hits) < depths[coll_key] or (size and depths[coll_key] >= size)
+        if exhausted or not hits:
+            continue
+        if hits[-1].weighted_score > kth_best:
+            depths[coll_key] *= 2
+            if size:
+                depths[coll_key] = min(depths[coll_key], size)
+            expand.append(coll_key)
+
+    return expand
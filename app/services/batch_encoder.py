@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Dict, List
+
+import numpy as np
+
+class BatchEncoder:
+    """
+    Dynamic micro-batching cho query encoder
+
+    Các request encode đồng thời được gom vào một batch (tối đa
+    max_batch_size query, chờ tối đa max_wait_ms kể từ query đầu tiên),
+    encode bằng MỘT lần gọi model.encode, rồi trả vector về từng caller.
+
+    Mọi lỗi trong worker được đặt lên Future của batch đang xử lý và worker
+    chạy tiếp; caller chờ tối đa timeout_ms nên không bao giờ treo vô hạn.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5,
+        timeout_ms: float = 10000
+    ):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.timeout = timeout_ms / 1000 if timeout_ms > 0 else None
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._max_batch = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_encode = 0.0
+
+        self._worker = threading.Thread(
+            target=self._run, name="batch-encoder", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Đưa query vào queue, Future có vector khi batch chứa nó xong"""
+        future: Future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """
+        Encode một query (block cho tới khi batch chứa nó được xử lý)
+
+        Raises concurrent.futures.TimeoutError nếu quá timeout.
+        """
+        future = self.submit(text)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _collect_batch(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = self._collect_batch()
+                self._process(batch)
+            except BaseException as e:
+                # Không để caller nào chờ Future không bao giờ xong
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                print(f"⚠️ Lỗi trong batch encoder: {e}")
+
+    def _process(self, batch: List[tuple]):
+        # Bỏ các request caller đã hủy (quá timeout)
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.monotonic()
+
+        # Gộp các query trùng nhau trong cùng batch
+        unique_texts = list(dict.fromkeys(item[0] for item in batch))
+
+        embeddings = self.model.encode(
+            unique_texts,
+            batch_size=len(unique_texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype(np.float32)
+
+        finished = time.monotonic()
+        index = {text: i for i, text in enumerate(unique_texts)}
+        for text, future, _ in batch:
+            future.set_result(embeddings[index[text]])
+
+        self._record(batch, started, finished)
+
+    def _record(self, batch: List[tuple], started: float, finished: float):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._max_batch = max(self._max_batch, len(batch))
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+            self._total_encode += finished - started
+
+    def stats(self) -> Dict:
+        """Thống kê batch size và thời gian chờ trong queue"""
+        with self._stats_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "requests": self._requests,
+                "avg_batch_size": self._requests / batches,
+                "largest_batch": self._max_batch,
+                "avg_queue_wait_ms": self._total_wait / requests * 1000,
+                "max_queue_wait_ms": self._max_wait_seen * 1000,
+                "avg_encode_ms": self._total_encode / batches * 1000,
+                "queue_depth": self._queue.qsize()
+            }
@@ -309,4 +309,48 @@ class ConversationService:
         return [
             {"role": msg.role, "content": msg.content}
             for msg in recent_messages
-        ]
\ No newline at end of file
+        ]
+
+    def get_conversation_history(
+        self, conversation_id: int, user_id: int
+    ) -> Optional[Dict]:
+        """Lịch sử hội thoại dạng JSON, None nếu không có hoặc không thuộc user"""
+        try:
+            conversation = self.get_conversation_with_messages(conversation_id)
+
+            if not conversation or conversation.user_id != user_id:
+                return None
+
+            return {
+                "conversation": {
+                    "id": conversation.id,
+                    "title": conversation.title,
+                    "created_at": conversation.created_at.isoformat(),
+                    "updated_at": conversation.updated_at.isoformat(),
+                },
+                "messages": [
+                    {
+                        "id": msg.id,
+                        "role": msg.role,
+                        "content": msg.content,
+                        "created_at": msg.created_at.isoformat(),
+                    }
+                    for msg in conversation.messages
+                ],
+            }
+
+        except Exception as e:
+            print(f"❌ Error getting conversation history: {e}")
+            return None
+
+    def list_user_conversations(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """Danh sách conversations của user dạng JSON"""
+        return [
+            {
+                "id": conv.id,
+                "title": conv.title,
+                "created_at": conv.created_at.isoformat(),
+                "updated_at": conv.updated_at.isoformat(),
+            }
+            for conv in self.get_user_conversations(user_id, limit)
+        ]
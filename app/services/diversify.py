@@ -0,0 +1,100 @@
+"""
+Đa dạng hóa kết quả sau merge: MMR + loại near-duplicate
+
+FAQ, policy và order guide hay lặp lại cùng một ý (ví dụ hủy đơn có ở cả
+faq và order_guide). Ma trận cosine giữa các candidates được tính bằng
+MỘT phép nhân ma trận, sau đó chọn tham lam theo maximal marginal
+relevance:
+
+    mmr(d) = λ * relevance(d) - (1 - λ) * max_{s ∈ đã chọn} cos(d, s)
+
+Candidate có cos với một kết quả đã chọn THUỘC COLLECTION KHÁC >=
+duplicate_threshold bị bỏ hẳn. Trong cùng collection (ví dụ các sản phẩm
+có chunk cùng template, cos thường > 0.92) chỉ có penalty MMR, không loại.
+"""
+
+from typing import Callable, List
+import numpy as np
+
+from app.models.search_hit import SearchHit
+
+def _relevance(hit: SearchHit) -> float:
+    if hit.rerank_score is not None:
+        return hit.rerank_score
+    if hit.fused_score is not None:
+        return hit.fused_score
+    return hit.weighted_score
+
+def mmr_diversify(
+    hits: List[SearchHit],
+    embeddings: np.ndarray,
+    n_results: int,
+    lambda_: float = 0.7,
+    duplicate_threshold: float = 0.92
+) -> List[SearchHit]:
+    """
+    Chọn tối đa n_results hits vừa liên quan vừa khác nhau
+
+    embeddings: (N, D) đã normalize, cùng thứ tự với hits. Hàng toàn 0
+    (không lấy được embedding) không bị coi là trùng với hit nào.
+    """
+    if len(hits) <= 1 or embeddings.size == 0:
+        return hits[:n_results]
+    
+    relevance = np.array([_relevance(hit) for hit in hits], dtype=np.float32)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+    
+    similarity = embeddings @ embeddings.T
+    collection_ids = {}
+    codes = np.array(
+        [collection_ids.setdefault(hit.collection, len(collection_ids)) for hit in hits]
+    )
+    
+    selected: List[int] = []
+    # max cos tới tập đã chọn, cập nhật tăng dần thay vì tính lại
+    max_sim = np.zeros(len(hits), dtype=np.float32)
+    available = np.ones(len(hits), dtype=bool)
+    
+    while available.any() and len(selected) < n_results:
+        if selected:
+            scores = lambda_ * relevance - (1 - lambda_) * max_sim
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, similarity[best])
+        # Near-duplicate chỉ tính giữa các collection khác nhau
+        duplicate = (similarity[best] >= duplicate_threshold) & (codes != codes[best])
+        available &= ~duplicate
+    
+    return [hits[i] for i in selected]
+
+def gather_embeddings(
+    hits: List[SearchHit],
+    get_embeddings: Callable[[str, List[str]], np.ndarray]
+) -> np.ndarray:
+    """
+    Embeddings (N, D) theo thứ tự hits, đọc theo từng collection một lần
+    """
+    by_collection = {}
+    for i, hit in enumerate(hits):
+        by_collection.setdefault(hit.collection, []).append(i)
+    
+    rows = {}
+    dim = 0
+    for coll_key, positions in by_collection.items():
+        vectors = get_embeddings(coll_key, [hits[i].id for i in positions])
+        if vectors.shape[1]:
+            dim = vectors.shape[1]
+        for i, vector in zip(positions, vectors):
+            rows[i] = vector
+    
+    embeddings = np.zeros((len(hits), dim), dtype=np.float32)
+    for i, vector in rows.items():
+        if vector.shape[0] == dim:
+            embeddings[i] = vector
+    return embeddings
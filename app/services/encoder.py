@@ -0,0 +1,100 @@
+"""
+Chọn backend cho query encoder
+
+- torch: SentenceTransformer mặc định
+- onnx: model được export sang ONNX, chạy bằng ONNX Runtime (CPU)
+- onnx-int8: ONNX + dynamic int8 quantization
+
+Model ONNX được export một lần vào ENCODER_EXPORT_DIR rồi tái sử dụng.
+Nếu thiếu optional dependencies (optimum / onnxruntime) thì fallback về
+torch thay vì làm service không khởi động được.
+"""
+
+import os
+from typing import Optional
+
+from sentence_transformers import SentenceTransformer
+
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def _session_options(num_threads: int):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if num_threads > 0:
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+    return options
+
+def _export_dir(export_root: str, model_name: str) -> str:
+    return os.path.join(export_root, model_name.replace("/", "__"))
+
+def _load_onnx(
+    model_name: str,
+    export_root: str,
+    quantization: Optional[str],
+    num_threads: int
+) -> SentenceTransformer:
+    export_dir = _export_dir(export_root, model_name)
+    file_name = "onnx/model.onnx"
+    if quantization:
+        file_name = f"onnx/model_qint8_{quantization}.onnx"
+
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        print(f"📦 Export encoder sang ONNX: {export_dir}")
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save(export_dir)
+        if quantization:
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            export_dynamic_quantized_onnx_model(model, quantization, export_dir)
+
+    return SentenceTransformer(
+        export_dir,
+        backend="onnx",
+        model_kwargs={
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": _session_options(num_threads),
+        }
+    )
+
+def load_encoder(
+    model_name: str,
+    backend: str = "torch",
+    max_seq_length: int = 0,
+    num_threads: int = 0,
+    export_root: str = "app/data/encoder_onnx",
+    quantization: str = "avx2"
+) -> SentenceTransformer:
+    """
+    Load query encoder theo backend
+
+    max_seq_length / num_threads = 0 nghĩa là giữ mặc định.
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"ENCODER_BACKEND không hợp lệ: {backend}")
+
+    model = None
+    if backend != "torch":
+        try:
+            model = _load_onnx(
+                model_name,
+                export_root,
+                quantization if backend == "onnx-int8" else None,
+                num_threads
+            )
+        except ImportError as e:
+            print(f"⚠️ Thiếu dependency cho backend {backend} ({e}), dùng torch")
+            backend = "torch"
+
+    if model is None:
+        if num_threads > 0:
+            import torch
+            torch.set_num_threads(num_threads)
+        model = SentenceTransformer(model_name)
+
+    if max_seq_length > 0:
+        model.max_seq_length = max_seq_length
+
+    print(f"✅ Query encoder: {model_name} ({backend}, max_seq_length={model.max_seq_length})")
+    return model
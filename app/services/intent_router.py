@@ -0,0 +1,99 @@
+"""
+Router intent/collection dựa trên embedding prototypes
+
+Centroid của từng collection và prototype của từng intent được tính sẵn
+lúc khởi động từ vector của các document trong chunk JSON. Khi route chỉ
+cần vài phép dot product với vector query ĐÃ CÓ - không encode thêm.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+def _normalize(vector: np.ndarray) -> Optional[np.ndarray]:
+    norm = float(np.linalg.norm(vector))
+    if norm == 0:
+        return None
+    return (vector / norm).astype(np.float32)
+
+class PrototypeRouter:
+    def __init__(
+        self,
+        collection_embeddings: Dict[str, np.ndarray],
+        intent_collections: Dict[str, List[str]],
+        min_similarity: float = 0.3,
+        intent_margin: float = 0.05,
+        collection_margin: float = 0.1
+    ):
+        self.min_similarity = min_similarity
+        self.intent_margin = intent_margin
+        self.collection_margin = collection_margin
+
+        # Centroid từng collection
+        self.collection_keys: List[str] = []
+        centroids = []
+        for coll_key, embeddings in collection_embeddings.items():
+            if len(embeddings) == 0:
+                continue
+            centroid = _normalize(embeddings.mean(axis=0))
+            if centroid is not None:
+                self.collection_keys.append(coll_key)
+                centroids.append(centroid)
+        self.collection_centroids = np.vstack(centroids) if centroids else None
+
+        # Prototype từng intent = centroid của mọi document thuộc các collections của intent
+        self.intents: List[str] = []
+        prototypes = []
+        for intent, collections in intent_collections.items():
+            members = [collection_embeddings[c] for c in collections
+                       if c in collection_embeddings and len(collection_embeddings[c])]
+            if not members:
+                continue
+            prototype = _normalize(np.vstack(members).mean(axis=0))
+            if prototype is not None:
+                self.intents.append(intent)
+                prototypes.append(prototype)
+        self.intent_prototypes = np.vstack(prototypes) if prototypes else None
+
+    def route_intent(self, query_embedding: np.ndarray) -> Optional[Tuple[str, float]]:
+        """
+        Intent gần nhất nếu đủ giống (>= min_similarity) và cách intent
+        thứ hai ít nhất intent_margin, ngược lại None
+        """
+        if self.intent_prototypes is None:
+            return None
+
+        similarities = self.intent_prototypes @ query_embedding
+        order = np.argsort(-similarities)
+        best = float(similarities[order[0]])
+        runner_up = float(similarities[order[1]]) if len(order) > 1 else -1.0
+
+        if best < self.min_similarity or best - runner_up < self.intent_margin:
+            return None
+        return self.intents[order[0]], best
+
+    def select_collections(
+        self,
+        query_embedding: np.ndarray,
+        candidates: List[str]
+    ) -> List[str]:
+        """
+        Bỏ các collections có centroid kém xa collection gần nhất
+        (similarity < best - collection_margin)
+        """
+        if self.collection_centroids is None:
+            return candidates
+
+        similarities = dict(zip(
+            self.collection_keys,
+            (self.collection_centroids @ query_embedding).tolist()
+        ))
+        known = [c for c in candidates if c in similarities]
+        if not known:
+            return candidates
+
+        best = max(similarities[c] for c in known)
+        selected = [
+            c for c in candidates
+            if c not in similarities or similarities[c] >= best - self.collection_margin
+        ]
+        return selected
@@ -0,0 +1,188 @@
+"""
+Aho-Corasick keyword automaton cho intent classification và keyword extraction
+
+Mọi bảng keyword (intent + product terms + tên danh mục) được compile MỘT
+lần thành automaton; một lượt quét tuyến tính qua query trả về đồng thời
+điểm của từng intent, các product terms và danh mục được nhắc tới.
+"""
+
+import json
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.core.text_utils import fold_diacritics, normalize_query
+
+# Keywords cho từng intent (thứ tự dict = thứ tự ưu tiên khi bằng điểm)
+INTENT_KEYWORDS = {
+    # Keywords cho product search - MỞ RỘNG
+    "product_search": [
+        "sản phẩm", "áo", "quần", "giày", "mua", "giá", "size", "màu",
+        "váy", "đầm", "shop", "bán", "có", "tìm", "mẫu", "loại",
+        "thun", "sơ mi", "khoác", "jean", "những", "nào", "gì"
+    ],
+    # Keywords cho order inquiry
+    "order_inquiry": [
+        "đơn hàng", "order", "giao hàng", "ship", "tracking", "trạng thái",
+        "hủy đơn", "đặt hàng", "mua hàng", "thanh toán"
+    ],
+    # Keywords cho support
+    "support": [
+        "làm sao", "như thế nào", "cách", "đổi trả", "hoàn tiền",
+        "chính sách", "bảo hành", "liên hệ", "hotline"
+    ],
+}
+
+PRODUCT_TERMS = [
+    "áo", "quần", "giày", "váy", "đầm", "thun", "sơ mi", "khoác",
+    "jean", "kaki", "polo", "hoodie", "nỉ", "len", "dạ"
+]
+
+PRODUCT_TERM_GROUP = "product_term"
+CATEGORY_GROUP = "category"
+
+def load_category_names(path: str) -> List[str]:
+    """Đọc tên danh mục từ categories_chunks.json"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        return [
+            doc["metadata"]["category_name"]
+            for doc in documents
+            if doc.get("metadata", {}).get("category_name")
+        ]
+    except Exception as e:
+        print(f"⚠️ Không thể đọc danh mục từ {path}: {e}")
+        return []
+
+class AhoCorasick:
+    """Automaton Aho-Corasick đơn giản trên ký tự Unicode"""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[tuple]] = [[]]
+
+    def add(self, pattern: str, payload: tuple):
+        node = 0
+        for char in pattern:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = next_node
+        self.output[node].append((len(pattern), payload))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter_matches(self, text: str):
+        """Yield (start, end, payload) cho mọi pattern xuất hiện trong text"""
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for length, payload in self.output[node]:
+                yield end - length, end, payload
+
+class KeywordMatch:
+    """Kết quả một lượt quét query"""
+
+    def __init__(self, intent_scores: Dict[str, int], product_terms: List[str], categories: List[str]):
+        self.intent_scores = intent_scores
+        self.product_terms = product_terms
+        self.categories = categories
+
+class KeywordMatcher:
+    """
+    Compile các bảng keyword thành một automaton
+
+    Mỗi keyword có thêm biến thể bỏ dấu ("áo khoác" -> "ao khoac") để bắt
+    query gõ không dấu. Biến thể bỏ dấu chỉ được tính khi khớp trọn từ,
+    tránh "co" (từ "có") khớp vào giữa "cotton".
+    """
+
+    def __init__(
+        self,
+        intent_keywords: Dict[str, List[str]],
+        product_terms: List[str],
+        category_names: Optional[List[str]] = None
+    ):
+        self.intents = list(intent_keywords.keys())
+        self.automaton = AhoCorasick()
+        self._order: Dict[tuple, int] = {}
+
+        groups = dict(intent_keywords)
+        groups[PRODUCT_TERM_GROUP] = product_terms
+        groups[CATEGORY_GROUP] = category_names or []
+
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                pattern = normalize_query(keyword)
+                key = (group, keyword)
+                if not pattern or key in self._order:
+                    continue
+                self._order[key] = len(self._order)
+                self.automaton.add(pattern, (group, keyword, False))
+                folded = fold_diacritics(pattern)
+                if folded != pattern:
+                    self.automaton.add(folded, (group, keyword, True))
+
+        self.automaton.build()
+
+    @classmethod
+    def from_category_file(cls, categories_path: str) -> "KeywordMatcher":
+        """
+        Bảng keyword mặc định + tên danh mục từ categories_chunks.json
+
+        Tên danh mục vừa là tín hiệu product_search, vừa là product term.
+        """
+        category_names = load_category_names(categories_path)
+        lowered = [normalize_query(name) for name in category_names]
+
+        intent_keywords = {k: list(v) for k, v in INTENT_KEYWORDS.items()}
+        intent_keywords["product_search"].extend(lowered)
+
+        return cls(intent_keywords, PRODUCT_TERMS + lowered, category_names)
+
+    def match(self, query: str) -> KeywordMatch:
+        query = normalize_query(query)
+        found = set()
+
+        for start, end, (group, keyword, folded) in self.automaton.iter_matches(query):
+            if folded and not self._is_whole_word(query, start, end):
+                continue
+            found.add((group, keyword))
+
+        intent_scores = {intent: 0 for intent in self.intents}
+        product_terms = []
+        categories = []
+        for group, keyword in sorted(found, key=self._order.get):
+            if group == PRODUCT_TERM_GROUP:
+                product_terms.append(keyword)
+            elif group == CATEGORY_GROUP:
+                categories.append(keyword)
+            else:
+                intent_scores[group] += 1
+
+        return KeywordMatch(intent_scores, product_terms, categories)
+
+    @staticmethod
+    def _is_whole_word(text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not before.isalnum() and not after.isalnum()
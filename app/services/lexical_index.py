@@ -0,0 +1,152 @@
+"""
+BM25 inverted index trên documents của các collections đang được index
+(dạng {id, text, metadata} như chunk JSON do *_data_builder sinh ra)
+
+Postings được tính sẵn trọng số BM25 cho từng (term, document), nên khi
+query chỉ cần cộng dồn postings của các term trong query - không phải
+quét text của từng document.
+"""
+
+import json
+import math
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.text_utils import has_diacritics, tokenize
+from app.models.search_hit import SearchHit
+from app.services.metadata_store import ColumnarMetadata
+
+# Collection key -> file chunk JSON tương ứng
+CHUNK_FILES = {
+    "products": "products_chunks.json",
+    "categories": "categories_chunks.json",
+    "faqs": "faqs_chunks.json",
+    "policies": "policies_chunks.json",
+    "order_guides": "order_guides_chunks.json",
+}
+
+def load_chunk_documents(chunks_dir: str, collections: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+    """Đọc documents ({id, text, metadata}) từ các file chunk JSON"""
+    documents = {}
+    for coll_key, filename in CHUNK_FILES.items():
+        if collections is not None and coll_key not in collections:
+            continue
+
+        path = os.path.join(chunks_dir, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                documents[coll_key] = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Không thể đọc {path}: {e}")
+
+    return documents
+
+class BM25Postings:
+    """Postings BM25 (đã tính sẵn trọng số) cho một cách tokenize"""
+
+    def __init__(self, token_lists: List[List[str]], k1: float, b: float):
+        n_docs = len(token_lists)
+        doc_lengths = np.array([len(t) for t in token_lists], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if n_docs else 0.0
+
+        raw_postings = defaultdict(list)
+        for doc_idx, tokens in enumerate(token_lists):
+            for term, tf in Counter(tokens).items():
+                raw_postings[term].append((doc_idx, tf))
+
+        self.postings: Dict[str, tuple] = {}
+        for term, entries in raw_postings.items():
+            doc_ids = np.array([d for d, _ in entries], dtype=np.int32)
+            tfs = np.array([tf for _, tf in entries], dtype=np.float32)
+            df = len(entries)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * doc_lengths[doc_ids] / (avg_length or 1.0))
+            weights = idf * tfs * (k1 + 1) / (tfs + norm)
+            self.postings[term] = (doc_ids, weights.astype(np.float32))
+
+    def score(self, query_tokens: List[str], n_docs: int) -> np.ndarray:
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term, count in Counter(query_tokens).items():
+            posting = self.postings.get(term)
+            if posting is not None:
+                doc_ids, weights = posting
+                scores[doc_ids] += count * weights
+        return scores
+
+class LexicalIndex:
+    """
+    BM25 index cho mọi collection
+
+    Có 2 bộ postings: giữ dấu (chính xác hơn) và bỏ dấu (cho query gõ
+    không dấu như "ao thun nam"). Query có dấu dùng bộ giữ dấu.
+    """
+
+    def __init__(self, documents: Dict[str, List[Dict]], k1: float = 1.5, b: float = 0.75):
+        self.collection_keys: List[str] = []
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        collection_ids = []
+
+        for coll_key, docs in documents.items():
+            coll_index = len(self.collection_keys)
+            self.collection_keys.append(coll_key)
+            for doc in docs:
+                self.ids.append(doc["id"])
+                self.texts.append(doc["text"])
+                self.metadatas.append(doc.get("metadata", {}))
+                collection_ids.append(coll_index)
+
+        self.collection_ids = np.array(collection_ids, dtype=np.int16)
+        self.columns = ColumnarMetadata(self.metadatas)
+        self.accented = BM25Postings([tokenize(t) for t in self.texts], k1, b)
+        self.folded = BM25Postings([tokenize(t, fold=True) for t in self.texts], k1, b)
+
+        print(f"✅ BM25 index: {len(self.ids)} documents, "
+              f"{len(self.accented.postings)} terms")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(
+        self,
+        query: str,
+        n_results: int,
+        collections: Optional[List[str]] = None,
+        where: Optional[Dict] = None
+    ) -> List[SearchHit]:
+        """Top-k document theo BM25, trả về SearchHit có lexical_score"""
+        if not self.ids:
+            return []
+
+        if has_diacritics(query):
+            scores = self.accented.score(tokenize(query), len(self.ids))
+        else:
+            scores = self.folded.score(tokenize(query, fold=True), len(self.ids))
+
+        if collections is not None:
+            wanted = [i for i, k in enumerate(self.collection_keys) if k in collections]
+            scores[~np.isin(self.collection_ids, wanted)] = 0
+        if where:
+            scores[~self.columns.mask(where)] = 0
+
+        n_matched = int(np.count_nonzero(scores > 0))
+        k = min(n_results, n_matched)
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            SearchHit(
+                self.ids[idx],
+                self.collection_keys[self.collection_ids[idx]],
+                metadata=self.metadatas[idx],
+                text=self.texts[idx],
+                lexical_score=float(scores[idx])
+            )
+            for idx in top
+        ]
@@ -0,0 +1,119 @@
+"""
+Columnar metadata store (NumPy arrays) cho pre-filter pushdown
+
+Mỗi key metadata (price, category_id, total_stock, avg_rating,
+review_count, ...) được lưu thành một mảng: số -> float64 (NaN nếu thiếu),
+còn lại -> object. Where filter kiểu Chroma được đánh giá thành boolean
+mask TRƯỚC khi tính điểm vector, nên filtered search vừa chính xác vừa rẻ.
+"""
+
+from numbers import Number
+from typing import Dict, List, Optional
+import numpy as np
+
+def _is_number(value) -> bool:
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+def combine_filters(conditions: List[Dict]) -> Optional[Dict]:
+    """Gộp nhiều điều kiện thành một where filter hợp lệ cho Chroma"""
+    conditions = [c for c in conditions if c]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+class ColumnarMetadata:
+    def __init__(self, metadatas: List[Dict]):
+        self.size = len(metadatas)
+        self.columns: Dict[str, np.ndarray] = {}
+
+        keys = set()
+        for metadata in metadatas:
+            keys.update((metadata or {}).keys())
+
+        for key in keys:
+            values = [(m or {}).get(key) for m in metadatas]
+            present = [v for v in values if v is not None]
+            if present and all(_is_number(v) for v in present):
+                self.columns[key] = np.array(
+                    [np.nan if v is None else v for v in values], dtype=np.float64
+                )
+            else:
+                column = np.empty(self.size, dtype=object)
+                column[:] = values
+                self.columns[key] = column
+
+    def mask(self, where: Optional[Dict]) -> np.ndarray:
+        """Đánh giá where filter (cú pháp Chroma) thành boolean mask"""
+        result = np.ones(self.size, dtype=bool)
+        if not where:
+            return result
+
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    result &= self.mask(sub)
+            elif key == "$or":
+                any_mask = np.zeros(self.size, dtype=bool)
+                for sub in condition:
+                    any_mask |= self.mask(sub)
+                result &= any_mask
+            else:
+                column = self.columns.get(key)
+                if column is None:
+                    return np.zeros(self.size, dtype=bool)
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for op, target in condition.items():
+                    result &= self._compare(column, op, target)
+
+        return result
+
+    def _compare(self, column: np.ndarray, op: str, target) -> np.ndarray:
+        if column.dtype == object:
+            return self._compare_objects(column, op, target)
+
+        present = ~np.isnan(column)
+        if op in ("$in", "$nin"):
+            targets = [t for t in target if _is_number(t)]
+            matched = np.isin(column, targets) & present
+            return matched if op == "$in" else present & ~matched
+        if not _is_number(target):
+            return present.copy() if op == "$ne" else np.zeros(self.size, dtype=bool)
+
+        if op == "$eq":
+            return column == target
+        if op == "$ne":
+            return present & (column != target)
+        if op == "$gt":
+            return column > target
+        if op == "$gte":
+            return column >= target
+        if op == "$lt":
+            return column < target
+        if op == "$lte":
+            return column <= target
+        raise ValueError(f"Operator không hỗ trợ: {op}")
+
+    def _compare_objects(self, column: np.ndarray, op: str, target) -> np.ndarray:
+        if op == "$eq":
+            check = lambda v: v == target
+        elif op == "$ne":
+            check = lambda v: v is not None and v != target
+        elif op == "$in":
+            check = lambda v: v in target
+        elif op == "$nin":
+            check = lambda v: v is not None and v not in target
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            compare = {
+                "$gt": lambda v: v > target,
+                "$gte": lambda v: v >= target,
+                "$lt": lambda v: v < target,
+                "$lte": lambda v: v <= target,
+            }[op]
+            check = lambda v: v is not None and type(v) is type(target) and compare(v)
+        else:
+            raise ValueError(f"Operator không hỗ trợ: {op}")
+
+        return np.fromiter((check(v) for v in column), dtype=bool, count=self.size)
@@ -0,0 +1,226 @@
+"""
+Rule-based parser cho ràng buộc có cấu trúc trong query sản phẩm
+
+"áo thun nam dưới 300k size XL" -> price <= 300000, size XL. Các ràng
+buộc được chuyển thành where filter (cú pháp Chroma) để engine chỉ chấm
+điểm các sản phẩm thỏa mãn, thay vì để LLM tự lọc trong prompt.
+
+Regex chạy trên query đã bỏ dấu nên "duoi 300k" và "dưới 300k" như nhau.
+Riêng "cỡ" được đổi thành "size" TRƯỚC khi bỏ dấu, vì "co" đã bỏ dấu còn
+là "có" ("shop có 20 mẫu"). Số không có đơn vị tiền chỉ được hiểu là giá
+khi query có ngữ cảnh giá ("giá", "tiền", "ngân sách").
+"""
+
+from typing import Dict, List, Optional
+import re
+
+from app.core.text_utils import fold_diacritics, normalize_query
+from app.services.metadata_store import combine_filters
+
+# Hệ số nhân theo đơn vị tiền (đã bỏ dấu)
+PRICE_UNITS = {
+    "k": 1_000,
+    "nghin": 1_000,
+    "ngan": 1_000,
+    "tr": 1_000_000,
+    "trieu": 1_000_000,
+    "cu": 1_000_000,
+    "d": 1,
+    "dong": 1,
+    "vnd": 1,
+}
+
+_NUMBER = r"(\d{1,3}(?:\.\d{3})+|\d+(?:[.,]\d+)?)"
+_UNIT = r"(k|nghin|ngan|trieu|tr|cu|dong|vnd|d)?"
+_AMOUNT = _NUMBER + r"\s*" + _UNIT + r"(?![a-z0-9])"
+
+RANGE_PATTERN = re.compile(
+    r"(?:(?<![a-z])(?:tu|gia)\s*)?" + _AMOUNT + r"\s*(?:den|toi|-|~)\s*" + _AMOUNT
+)
+MAX_PATTERN = re.compile(
+    r"(?<![a-z])(?:duoi|khong qua|toi da|nho hon|re hon|max|<=?)\s*" + _AMOUNT
+)
+MIN_PATTERN = re.compile(
+    r"(?<![a-z])(?:tren|tu|toi thieu|lon hon|min|>=?)\s*" + _AMOUNT
+)
+AROUND_PATTERN = re.compile(
+    r"(?<![a-z])(?:khoang|tam|gia)\s*" + _AMOUNT
+)
+# "tiền" đứng một mình không phải tín hiệu giá ("hoàn tiền mất 3-5 ngày"),
+# chỉ tính trong cụm như "giá tiền" (đã khớp "giá"), "bao nhiêu tiền"
+PRICE_CONTEXT_PATTERN = re.compile(
+    r"(?<![a-z])(?:gia|ngan sach|bao nhieu tien|so tien)(?![a-z])"
+)
+# "1tr5" = 1,5 triệu, "1k5" = 1,5 nghìn
+COMPACT_AMOUNT_PATTERN = re.compile(r"(\d+)\s*(trieu|tr|cu|k)(\d{1,3})(?![a-z0-9])")
+# Khoảng giá khi query chỉ nói "khoảng 300k"
+AROUND_TOLERANCE = 0.2
+
+_SIZE = r"(xxxl|xxl|xl|xs|s|m|l|[234]xl|\d{2})"
+SIZE_PATTERN = re.compile(r"(?<![a-z])(?:size|sz)\s*" + _SIZE + r"(?![a-z0-9])")
+SIZE_RANGE_PATTERN = re.compile(
+    r"(?<![a-z])(?:size|sz)\s*" + _SIZE + r"\s*(?:-|~|den|toi)\s*"
+    + r"(?:size\s*|sz\s*)?" + _SIZE + r"(?![a-z0-9])"
+)
+# Thứ tự size chữ để mở rộng khoảng "size S-XL"
+LETTER_SIZES = ["xs", "s", "m", "l", "xl", "xxl", "xxxl"]
+# Khoảng size số tối đa được mở rộng (tránh "size 30-300")
+MAX_SIZE_SPAN = 10
+# Size đứng một mình chỉ nhận các giá trị không thể là từ khác
+BARE_SIZE_PATTERN = re.compile(r"(?<![a-z0-9])(xxxl|xxl|xl|xs|[234]xl)(?![a-z0-9])")
+
+def size_metadata_key(size: str) -> str:
+    """Key metadata boolean cho một size ("XL" -> "size_xl")"""
+    return "size_" + re.sub(r"[^a-z0-9]", "", fold_diacritics(str(size).lower()))
+
+def _expand_size_range(low: str, high: str) -> List[str]:
+    """"38"-"40" -> 38, 39, 40; "s"-"xl" -> S, M, L, XL"""
+    low = {"2xl": "xxl", "3xl": "xxxl"}.get(low, low)
+    high = {"2xl": "xxl", "3xl": "xxxl"}.get(high, high)
+    if low.isdigit() and high.isdigit():
+        start, end = sorted((int(low), int(high)))
+        if end - start <= MAX_SIZE_SPAN:
+            return [str(size) for size in range(start, end + 1)]
+    elif low in LETTER_SIZES and high in LETTER_SIZES:
+        start, end = sorted((LETTER_SIZES.index(low), LETTER_SIZES.index(high)))
+        return [size.upper() for size in LETTER_SIZES[start:end + 1]]
+    return [low.upper(), high.upper()]
+
+def _parse_amount(number: str, unit: Optional[str], default_unit: Optional[str] = None) -> float:
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+", number):
+        value = float(number.replace(".", ""))
+    else:
+        value = float(number.replace(",", "."))
+
+    unit = unit or default_unit
+    if unit:
+        return value * PRICE_UNITS[unit]
+    # Không có đơn vị: "dưới 300" hiểu là 300 nghìn
+    return value * 1_000 if value < 1_000 else value
+
+class ParsedQuery:
+    """Các ràng buộc trích ra từ một query"""
+
+    def __init__(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sizes: Optional[List[str]] = None,
+        categories: Optional[List[str]] = None
+    ):
+        self.min_price = min_price
+        self.max_price = max_price
+        self.sizes = sizes or []
+        self.categories = categories or []
+
+    @property
+    def has_constraints(self) -> bool:
+        return bool(
+            self.min_price is not None or self.max_price is not None
+            or self.sizes or self.categories
+        )
+
+    def to_filter(
+        self,
+        include_sizes: bool = True,
+        include_categories: bool = True
+    ) -> Optional[Dict]:
+        """Where filter cho products collection"""
+        conditions = []
+        if self.min_price is not None:
+            conditions.append({"price": {"$gte": self.min_price}})
+        if self.max_price is not None:
+            conditions.append({"price": {"$lte": self.max_price}})
+        if include_categories and self.categories:
+            if len(self.categories) == 1:
+                conditions.append({"category_name": self.categories[0]})
+            else:
+                conditions.append({"category_name": {"$in": list(self.categories)}})
+        if include_sizes and self.sizes:
+            size_conditions = [{size_metadata_key(s): True} for s in self.sizes]
+            if len(size_conditions) == 1:
+                conditions.append(size_conditions[0])
+            else:
+                conditions.append({"$or": size_conditions})
+        return combine_filters(conditions)
+
+    def relaxed_filters(self) -> List[Optional[Dict]]:
+        """
+        Các filter từ chặt đến lỏng, kết thúc bằng None (không lọc)
+
+        Dùng để fallback khi filter đầy đủ không trả về sản phẩm nào
+        (ví dụ index cũ chưa có metadata size).
+        """
+        candidates = [
+            self.to_filter(),
+            self.to_filter(include_sizes=False),
+            self.to_filter(include_sizes=False, include_categories=False),
+            None,
+        ]
+        filters = []
+        for where in candidates:
+            if where not in filters:
+                filters.append(where)
+        return filters
+
+    def to_dict(self) -> Dict:
+        return {
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "sizes": self.sizes,
+            "categories": self.categories,
+        }
+
+def parse_query(query: str, categories: Optional[List[str]] = None) -> ParsedQuery:
+    """
+    Trích khoảng giá và size từ query
+
+    categories: tên danh mục đã match sẵn (KeywordMatch.categories), để
+    không phải quét danh sách danh mục thêm một lần.
+    """
+    text = normalize_query(query).replace("cỡ", "size")
+    text = fold_diacritics(text)
+    text = COMPACT_AMOUNT_PATTERN.sub(r"\1,\3\2", text)
+
+    # Size trước: bỏ khỏi text để "size 38-40" không bị đọc thành giá
+    sizes = []
+    for pattern in (SIZE_RANGE_PATTERN, SIZE_PATTERN, BARE_SIZE_PATTERN):
+        for match in pattern.finditer(text):
+            if pattern is SIZE_RANGE_PATTERN:
+                sizes.extend(_expand_size_range(match.group(1), match.group(2)))
+            else:
+                sizes.append(match.group(1).upper())
+        text = pattern.sub(" ", text)
+
+    # Số không có đơn vị chỉ là giá khi query nói tới giá
+    price_context = bool(PRICE_CONTEXT_PATTERN.search(text))
+    min_price = max_price = None
+
+    match = RANGE_PATTERN.search(text)
+    if match and not (match.group(2) or match.group(4) or price_context):
+        match = None
+    if match:
+        # "từ 200 đến 500 nghìn": đơn vị của vế sau áp dụng cho cả vế trước
+        low = _parse_amount(match.group(1), match.group(2), match.group(4))
+        high = _parse_amount(match.group(3), match.group(4), match.group(2))
+        min_price, max_price = min(low, high), max(low, high)
+    else:
+        match = MAX_PATTERN.search(text)
+        if match and (match.group(2) or price_context):
+            max_price = _parse_amount(match.group(1), match.group(2))
+        match = MIN_PATTERN.search(text)
+        if match and (match.group(2) or price_context):
+            min_price = _parse_amount(match.group(1), match.group(2))
+        if min_price is None and max_price is None:
+            match = AROUND_PATTERN.search(text)
+            if match and (match.group(2) or price_context):
+                price = _parse_amount(match.group(1), match.group(2))
+                min_price = price * (1 - AROUND_TOLERANCE)
+                max_price = price * (1 + AROUND_TOLERANCE)
+
+    return ParsedQuery(
+        min_price=min_price,
+        max_price=max_price,
+        sizes=list(dict.fromkeys(sizes)),
+        categories=list(categories or [])
+    )
@@ -0,0 +1,105 @@
+"""
+Khởi tạo RAGService ngoài luồng import
+
+Import router không còn kéo theo torch / sentence-transformers / chromadb /
+Groq: RAGService được import và dựng trong lifespan của app (ở thread
+riêng), sau đó warm-up bằng một lần encode + query giả. Trong lúc đó
+server vẫn nhận request: /api/health trả về ngay, /api/ready báo false.
+
+Thread đang dựng không thể bị kill khi app tắt: shutdown() bật cờ để
+build_rag_service dừng ở bước kế tiếp và đóng các executor đã tạo.
+"""
+
+import threading
+import time
+from typing import Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.services.conversation_service import ConversationService
+    from app.services.rag_service import RAGService
+
+_lock = threading.Lock()
+_rag_service: Optional["RAGService"] = None
+_ready = threading.Event()
+_shutdown = threading.Event()
+_conversation_lock = threading.Lock()
+_conversation_service: Optional["ConversationService"] = None
+_state: Dict = {"status": "not_started", "error": None, "startup_seconds": None}
+
+def build_rag_service() -> Optional["RAGService"]:
+    """
+    Dựng RAGService và warm-up (blocking, gọi một lần trong lifespan)
+
+    Trả về None nếu app tắt trước khi dựng xong
+    """
+    global _rag_service
+
+    with _lock:
+        if _rag_service is not None:
+            return _rag_service
+
+        _state["status"] = "loading"
+        started = time.monotonic()
+        try:
+            # Import nặng (torch, chromadb, groq) chỉ xảy ra ở đây
+            from app.services.rag_service import RAGService
+
+            service = RAGService()
+            if _shutdown.is_set():
+                return _abort(service)
+            _state["status"] = "warming_up"
+            service.search_service.warm_up()
+            if _shutdown.is_set():
+                return _abort(service)
+        except Exception as e:
+            _state["status"] = "failed"
+            _state["error"] = str(e)
+            print(f"❌ Khởi tạo RAGService thất bại: {e}")
+            raise
+
+        _rag_service = service
+        _state["status"] = "ready"
+        _state["startup_seconds"] = round(time.monotonic() - started, 2)
+        _ready.set()
+        print(f"✅ RAGService sẵn sàng sau {_state['startup_seconds']}s")
+        return service
+
+def _abort(service: "RAGService") -> None:
+    service.search_service.shutdown()
+    _state["status"] = "cancelled"
+    print("⚠️ App tắt trong lúc khởi tạo, bỏ RAGService đang dựng dở")
+    return None
+
+def shutdown():
+    """
+    Gọi khi app tắt: dừng build đang chạy ở bước kế tiếp, đóng executors
+    của RAGService đã dựng
+    """
+    _shutdown.set()
+    _ready.clear()
+    service = _rag_service
+    if service is not None:
+        service.search_service.shutdown()
+
+def get_rag_service() -> Optional["RAGService"]:
+    """RAGService đã warm-up, None nếu chưa sẵn sàng"""
+    return _rag_service if _ready.is_set() else None
+
+def get_conversation_service() -> "ConversationService":
+    """
+    ConversationService chỉ cần database, không chờ encoder / indexes
+    """
+    global _conversation_service
+
+    if _conversation_service is None:
+        with _conversation_lock:
+            if _conversation_service is None:
+                from app.services.conversation_service import ConversationService
+                _conversation_service = ConversationService()
+    return _conversation_service
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def readiness() -> Dict:
+    return {"ready": _ready.is_set(), **_state}
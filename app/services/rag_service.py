@@ -1,7 +1,10 @@
 from typing import Dict, Optional, List
+import asyncio
 from app.services.search_service import SearchService
 from app.services.conversation_service import ConversationService
 from app.core.llm_client import GroqClient
+from app.services.metadata_store import combine_filters
+from app.models.search_hit import SearchHit
 
 class RAGService:
     """
@@ -35,32 +38,13 @@ class RAGService:
                 "conversation_id": int,
                 "user_message": Message,
                 "assistant_message": Message,
-                "retrieved_context": List[Dict],
+                "retrieved_context": List[SearchHit],
                 "intent": str
             }
         """
         
         try:
-            # Step 1: Lấy hoặc tạo conversation
-            if conversation_id is None:
-                # Tạo conversation mới
-                conversation = self.conversation_service.create_conversation(
-                    user_id=user_id,
-                    title=self._generate_conversation_title(message)
-                )
-                conversation_id = conversation.id
-            else:
-                # Kiểm tra conversation có tồn tại không
-                conversation = self.conversation_service.get_conversation(conversation_id)
-                if not conversation:
-                    raise ValueError(f"Conversation {conversation_id} không tồn tại")
-            
-            # Step 2: Lưu user message
-            user_msg = self.conversation_service.add_message(
-                conversation_id=conversation_id,
-                role="user",
-                content=message
-            )
+            conversation_id, user_msg = self._start_turn(user_id, message, conversation_id)
             
             # Step 3: Smart search để lấy context
             search_result = self.search_service.smart_search(
@@ -68,47 +52,123 @@ class RAGService:
                 n_results=n_results
             )
             
-            retrieved_context = search_result["results"]
-            intent = search_result["intent"]
+            return self._finish_turn(conversation_id, user_msg, message, search_result)
             
-            # Step 4: Lấy conversation history
-            conversation_history = self.conversation_service.get_conversation_history_for_llm(
-                conversation_id=conversation_id,
-                limit=10
+        except Exception as e:
+            print(f"❌ Error in RAG chat: {e}")
+            raise
+    
+    async def achat(
+        self,
+        user_id: int,
+        message: str,
+        conversation_id: Optional[int] = None,
+        n_results: int = 10
+    ) -> Dict:
+        """
+        Bản async của chat
+
+        Search chạy trên executors của SearchService, các bước DB / LLM
+        (blocking) chạy trong thread pool mặc định của event loop.
+        """
+        try:
+            conversation_id, user_msg = await asyncio.to_thread(
+                self._start_turn, user_id, message, conversation_id
             )
             
-            # Step 5: Generate response từ LLM
-            assistant_response = self.llm_client.generate_response(
-                user_message=message,
-                context=retrieved_context,
-                conversation_history=conversation_history[:-1]  # Exclude current message
+            search_result = await self.search_service.asmart_search(
+                query=message,
+                n_results=n_results
             )
             
-            # Step 6: Lưu assistant response
-            assistant_msg = self.conversation_service.add_message(
-                conversation_id=conversation_id,
-                role="assistant",
-                content=assistant_response,
-                metadata={
-                    "intent": intent,
-                    "retrieved_docs_count": len(retrieved_context),
-                    "top_collection": retrieved_context[0]["collection"] if retrieved_context else None
-                }
+            return await asyncio.to_thread(
+                self._finish_turn, conversation_id, user_msg, message, search_result
             )
             
-            # Step 7: Return response
-            return {
-                "conversation_id": conversation_id,
-                "user_message": user_msg,
-                "assistant_message": assistant_msg,
-                "retrieved_context": retrieved_context[:3],  # Chỉ trả về top 3 cho frontend
-                "intent": intent
-            }
-            
         except Exception as e:
             print(f"❌ Error in RAG chat: {e}")
             raise
     
+    def _start_turn(
+        self,
+        user_id: int,
+        message: str,
+        conversation_id: Optional[int]
+    ):
+        """
+        Step 1-2: lấy hoặc tạo conversation, lưu user message
+        """
+        # Step 1: Lấy hoặc tạo conversation
+        if conversation_id is None:
+            # Tạo conversation mới
+            conversation = self.conversation_service.create_conversation(
+                user_id=user_id,
+                title=self._generate_conversation_title(message)
+            )
+            conversation_id = conversation.id
+        else:
+            # Kiểm tra conversation có tồn tại không
+            conversation = self.conversation_service.get_conversation(conversation_id)
+            if not conversation:
+                raise ValueError(f"Conversation {conversation_id} không tồn tại")
+        
+        # Step 2: Lưu user message
+        user_msg = self.conversation_service.add_message(
+            conversation_id=conversation_id,
+            role="user",
+            content=message
+        )
+        
+        return conversation_id, user_msg
+    
+    def _finish_turn(
+        self,
+        conversation_id: int,
+        user_msg,
+        message: str,
+        search_result: Dict
+    ) -> Dict:
+        """
+        Step 4-7: gọi LLM với context đã search và lưu câu trả lời
+        """
+        retrieved_context = search_result["results"]
+        intent = search_result["intent"]
+        
+        # Step 4: Lấy conversation history
+        conversation_history = self.conversation_service.get_conversation_history_for_llm(
+            conversation_id=conversation_id,
+            limit=10
+        )
+        
+        # Step 5: Generate response từ LLM
+        assistant_response = self.llm_client.generate_response(
+            user_message=message,
+            context=retrieved_context,
+            conversation_history=conversation_history[:-1]  # Exclude current message
+        )
+        
+        # Step 6: Lưu assistant response
+        assistant_msg = self.conversation_service.add_message(
+            conversation_id=conversation_id,
+            role="assistant",
+            content=assistant_response,
+            metadata={
+                "intent": intent,
+                "retrieved_docs_count": len(retrieved_context),
+                "top_collection": retrieved_context[0].collection if retrieved_context else None,
+                "timed_out_collections": search_result["timed_out_collections"]
+            }
+        )
+        
+        # Step 7: Return response
+        return {
+            "conversation_id": conversation_id,
+            "user_message": user_msg,
+            "assistant_message": assistant_msg,
+            "retrieved_context": retrieved_context[:3],  # Chỉ trả về top 3 cho frontend
+            "intent": intent
+        }
+    
     def stream_chat(
         self,
         user_id: int,
@@ -124,20 +184,7 @@ class RAGService:
         """
         
         try:
-            # Setup conversation (tương tự như chat)
-            if conversation_id is None:
-                conversation = self.conversation_service.create_conversation(
-                    user_id=user_id,
-                    title=self._generate_conversation_title(message)
-                )
-                conversation_id = conversation.id
-            
-            # Save user message
-            user_msg = self.conversation_service.add_message(
-                conversation_id=conversation_id,
-                role="user",
-                content=message
-            )
+            conversation_id, _ = self._start_turn(user_id, message, conversation_id)
             
             # Search context
             search_result = self.search_service.smart_search(
@@ -145,53 +192,68 @@ class RAGService:
                 n_results=n_results
             )
             
-            retrieved_context = search_result["results"]
-            intent = search_result["intent"]
+            metadata, stream = self._open_stream(conversation_id, message, search_result)
+            yield metadata
             
-            # Get conversation history
-            conversation_history = self.conversation_service.get_conversation_history_for_llm(
-                conversation_id=conversation_id,
-                limit=10
-            )
+            # Stream response
+            full_response = ""
+            for chunk in stream:
+                full_response += chunk
+                yield {
+                    "type": "content",
+                    "chunk": chunk
+                }
             
-            # Yield metadata first
+            yield self._finish_stream(conversation_id, full_response, search_result)
+            
+        except Exception as e:
+            print(f"❌ Error in stream chat: {e}")
             yield {
-                "type": "metadata",
-                "conversation_id": conversation_id,
-                "intent": intent,
-                "context_count": len(retrieved_context)
+                "type": "error",
+                "error": str(e)
             }
+    
+    async def astream_chat(
+        self,
+        user_id: int,
+        message: str,
+        conversation_id: Optional[int] = None,
+        n_results: int = 10
+    ):
+        """
+        Bản async của stream_chat: mỗi chunk từ LLM được đọc trong thread
+        riêng nên event loop vẫn phục vụ các connection khác
+        """
+        try:
+            conversation_id, _ = await asyncio.to_thread(
+                self._start_turn, user_id, message, conversation_id
+            )
+            
+            search_result = await self.search_service.asmart_search(
+                query=message,
+                n_results=n_results
+            )
+            
+            metadata, stream = await asyncio.to_thread(
+                self._open_stream, conversation_id, message, search_result
+            )
+            yield metadata
             
-            # Stream response
             full_response = ""
-            for chunk in self.llm_client.generate_stream_response(
-                user_message=message,
-                context=retrieved_context,
-                conversation_history=conversation_history[:-1]
-            ):
+            while True:
+                chunk = await asyncio.to_thread(next, stream, None)
+                if chunk is None:
+                    break
                 full_response += chunk
                 yield {
                     "type": "content",
                     "chunk": chunk
                 }
             
-            # Save complete response
-            assistant_msg = self.conversation_service.add_message(
-                conversation_id=conversation_id,
-                role="assistant",
-                content=full_response,
-                metadata={
-                    "intent": intent,
-                    "retrieved_docs_count": len(retrieved_context)
-                }
+            yield await asyncio.to_thread(
+                self._finish_stream, conversation_id, full_response, search_result
             )
             
-            # Yield completion
-            yield {
-                "type": "complete",
-                "message_id": assistant_msg.id
-            }
-            
         except Exception as e:
             print(f"❌ Error in stream chat: {e}")
             yield {
@@ -199,6 +261,49 @@ class RAGService:
                 "error": str(e)
             }
     
+    def _open_stream(self, conversation_id: int, message: str, search_result: Dict):
+        """
+        Lấy history và mở stream LLM, trả về (event metadata, iterator chunks)
+        """
+        retrieved_context = search_result["results"]
+        
+        conversation_history = self.conversation_service.get_conversation_history_for_llm(
+            conversation_id=conversation_id,
+            limit=10
+        )
+        
+        metadata = {
+            "type": "metadata",
+            "conversation_id": conversation_id,
+            "intent": search_result["intent"],
+            "context_count": len(retrieved_context)
+        }
+        stream = iter(self.llm_client.generate_stream_response(
+            user_message=message,
+            context=retrieved_context,
+            conversation_history=conversation_history[:-1]
+        ))
+        return metadata, stream
+    
+    def _finish_stream(self, conversation_id: int, full_response: str, search_result: Dict) -> Dict:
+        """
+        Lưu câu trả lời đã stream xong, trả về event complete
+        """
+        assistant_msg = self.conversation_service.add_message(
+            conversation_id=conversation_id,
+            role="assistant",
+            content=full_response,
+            metadata={
+                "intent": search_result["intent"],
+                "retrieved_docs_count": len(search_result["results"]),
+                "timed_out_collections": search_result["timed_out_collections"]
+            }
+        )
+        return {
+            "type": "complete",
+            "message_id": assistant_msg.id
+        }
+    
     def get_conversation_history(
         self,
         conversation_id: int,
@@ -207,56 +312,13 @@ class RAGService:
         """
         Lấy lịch sử hội thoại
         """
-        try:
-            conversation = self.conversation_service.get_conversation_with_messages(
-                conversation_id
-            )
-            
-            if not conversation or conversation.user_id != user_id:
-                return None
-            
-            return {
-                "conversation": {
-                    "id": conversation.id,
-                    "title": conversation.title,
-                    "created_at": conversation.created_at.isoformat(),
-                    "updated_at": conversation.updated_at.isoformat()
-                },
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "role": msg.role,
-                        "content": msg.content,
-                        "created_at": msg.created_at.isoformat()
-                    }
-                    for msg in conversation.messages
-                ]
-            }
-            
-        except Exception as e:
-            print(f"❌ Error getting conversation history: {e}")
-            return None
+        return self.conversation_service.get_conversation_history(
+            conversation_id, user_id
+        )
     
     def get_user_conversations(self, user_id: int, limit: int = 20) -> List[Dict]:
         """Lấy danh sách conversations của user"""
-        try:
-            conversations = self.conversation_service.get_user_conversations(
-                user_id, limit
-            )
-            
-            return [
-                {
-                    "id": conv.id,
-                    "title": conv.title,
-                    "created_at": conv.created_at.isoformat(),
-                    "updated_at": conv.updated_at.isoformat()
-                }
-                for conv in conversations
-            ]
-            
-        except Exception as e:
-            print(f"❌ Error getting user conversations: {e}")
-            return []
+        return self.conversation_service.list_user_conversations(user_id, limit)
     
     def _generate_conversation_title(self, first_message: str) -> str:
         """
@@ -274,40 +336,128 @@ class RAGService:
         category: Optional[str] = None,
         min_price: Optional[float] = None,
         max_price: Optional[float] = None,
-        n_results: int = 10
-    ) -> List[Dict]:
+        n_results: int = 10,
+        in_stock: Optional[bool] = None,
+        min_rating: Optional[float] = None
+    ) -> List[SearchHit]:
         """
         Search sản phẩm với filters
+
+        Mọi filter được đẩy xuống vector engine (where filter) và áp dụng
+        TRƯỚC khi tính điểm, nên kết quả luôn đủ n_results nếu có đủ sản phẩm
+        thỏa điều kiện.
         """
         try:
-            # Build filter
-            filter_dict = {}
-            if category:
-                filter_dict["category_name"] = category
+            filter_metadata = self._build_product_filter(
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                in_stock=in_stock,
+                min_rating=min_rating
+            )
             
-            # Search
-            results = self.search_service.search(
+            return self.search_service.search(
                 query=query,
-                n_results=n_results * 2,  # Get more for filtering
+                n_results=n_results,
                 collections=["products"],
-                filter_metadata=filter_dict if filter_dict else None
+                filter_metadata=filter_metadata
             )
             
-            # Filter by price range
-            if min_price is not None or max_price is not None:
-                filtered_results = []
-                for result in results:
-                    price = result['metadata'].get('price', 0)
-                    if min_price is not None and price < min_price:
-                        continue
-                    if max_price is not None and price > max_price:
-                        continue
-                    filtered_results.append(result)
-                results = filtered_results
+        except Exception as e:
+            print(f"❌ Error searching products: {e}")
+            return []
+    
+    async def asearch_products(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        n_results: int = 10,
+        in_stock: Optional[bool] = None,
+        min_rating: Optional[float] = None
+    ) -> List[SearchHit]:
+        """
+        Bản async của search_products
+        """
+        try:
+            filter_metadata = self._build_product_filter(
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                in_stock=in_stock,
+                min_rating=min_rating
+            )
             
-            # Return top N
-            return results[:n_results]
+            return await self.search_service.asearch(
+                query=query,
+                n_results=n_results,
+                collections=["products"],
+                filter_metadata=filter_metadata
+            )
             
         except Exception as e:
             print(f"❌ Error searching products: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def search_products_batch(self, requests: List[Dict]) -> List[List[SearchHit]]:
+        """
+        Search sản phẩm cho nhiều query một lần (encode + lookup theo batch)
+
+        Mỗi request có cùng các key như tham số của search_products.
+        Kết quả theo đúng thứ tự requests.
+        """
+        return self.search_service.search_batch(
+            self._build_batch_queries(requests), collections=["products"]
+        )
+    
+    async def asearch_products_batch(self, requests: List[Dict]) -> List[List[SearchHit]]:
+        """
+        Bản async của search_products_batch
+        """
+        return await self.search_service.asearch_batch(
+            self._build_batch_queries(requests), collections=["products"]
+        )
+    
+    def _build_batch_queries(self, requests: List[Dict]) -> List[Dict]:
+        return [
+            {
+                "query": request["query"],
+                "n_results": request.get("n_results", 10),
+                "filter_metadata": self._build_product_filter(
+                    category=request.get("category"),
+                    min_price=request.get("min_price"),
+                    max_price=request.get("max_price"),
+                    in_stock=request.get("in_stock"),
+                    min_rating=request.get("min_rating")
+                )
+            }
+            for request in requests
+        ]
+    
+    def _build_product_filter(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: Optional[bool] = None,
+        min_rating: Optional[float] = None
+    ) -> Optional[Dict]:
+        """
+        Build where filter (cú pháp Chroma) cho products collection
+        """
+        conditions = []
+        if category:
+            conditions.append({"category_name": category})
+        if min_price is not None:
+            conditions.append({"price": {"$gte": min_price}})
+        if max_price is not None:
+            conditions.append({"price": {"$lte": max_price}})
+        if in_stock is True:
+            conditions.append({"total_stock": {"$gt": 0}})
+        elif in_stock is False:
+            conditions.append({"total_stock": {"$lte": 0}})
+        if min_rating is not None:
+            conditions.append({"avg_rating": {"$gte": min_rating}})
+        
+        return combine_filters(conditions)
@@ -0,0 +1,51 @@
+"""
+Reciprocal-rank fusion (RRF) giữa ranking dense và ranking BM25
+
+    fused_score(d) = Σ 1 / (rrf_k + rank_r(d)) trên các ranking r chứa d
+
+Chỉ dùng thứ hạng nên không phải chuẩn hóa điểm cosine và điểm BM25 về
+cùng thang đo.
+"""
+
+from typing import List
+
+from app.models.search_hit import SearchHit
+
+def reciprocal_rank_fusion(
+    dense: List[SearchHit],
+    lexical: List[SearchHit],
+    n_results: int,
+    rrf_k: int = 60,
+    boost_products: bool = False
+) -> List[SearchHit]:
+    """
+    Fuse hai ranking (đã sắp giảm dần), trả về top n_results theo fused_score
+
+    Hit chỉ có ở phía lexical cũng được đưa vào danh sách. boost_products:
+    cộng nửa phiếu rank 1 cho products (query là product-related).
+    """
+    fused = {}
+
+    for rank, result in enumerate(dense, 1):
+        result.lexical_score = 0.0
+        result.fused_score = 1.0 / (rrf_k + rank)
+        fused[(result.collection, result.id)] = result
+
+    for rank, hit in enumerate(lexical, 1):
+        key = (hit.collection, hit.id)
+        result = fused.get(key)
+        if result is None:
+            # Chỉ match lexical: chưa có dense score
+            result = hit
+            result.fused_score = 0.0
+            fused[key] = result
+        result.lexical_score = hit.lexical_score
+        result.fused_score += 1.0 / (rrf_k + rank)
+
+    if boost_products:
+        for result in fused.values():
+            if result.collection == "products":
+                result.fused_score += 0.5 / (rrf_k + 1)
+
+    reranked = sorted(fused.values(), key=lambda x: x.fused_score, reverse=True)
+    return reranked[:n_results]
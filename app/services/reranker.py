@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.core.cache import LRUCache
+from app.core.text_utils import normalize_query
+from app.models.search_hit import SearchHit
+
+class CrossEncoderReranker:
+    """
+    Rerank bằng cross-encoder
+
+    Mọi cặp (query, candidate) được chấm trong MỘT lần forward theo batch
+    trên CPU, tối đa max_candidates candidates. Điểm từng cặp được cache
+    theo (version index, hash query đã chuẩn hóa, collection, doc id):
+    sau khi rebuild, doc id có text mới không dùng lại điểm cũ.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_candidates: int = 20,
+        cache_size: int = 10000,
+        cache_ttl: float = 3600
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.max_candidates = max_candidates
+        self.score_cache = LRUCache(max_size=cache_size, ttl=cache_ttl)
+
+        self._stats_lock = threading.Lock()
+        self._latency: Dict[str, Dict] = {}
+
+    def rerank(
+        self,
+        query: str,
+        results: List[SearchHit],
+        intent: str = "general",
+        index_version: str = ""
+    ) -> Tuple[List[SearchHit], Dict]:
+        """
+        Sắp xếp lại max_candidates kết quả đầu theo rerank_score
+
+        Returns:
+            (results đã sắp xếp, stats của stage: latency, số cặp chấm/cache)
+        """
+        started = time.perf_counter()
+        candidates = results[:self.max_candidates]
+        rest = results[self.max_candidates:]
+
+        query_hash = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+        keys = [(index_version, query_hash, r.collection, r.id) for r in candidates]
+
+        scores = [self.score_cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        if missing:
+            predicted = self.model.predict(
+                [(query, candidates[i].text) for i in missing],
+                batch_size=len(missing),
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            for i, score in zip(missing, np.asarray(predicted, dtype=np.float32).tolist()):
+                scores[i] = score
+                self.score_cache.set(keys[i], score)
+
+        for result, score in zip(candidates, scores):
+            result.rerank_score = float(score)
+        candidates.sort(key=lambda x: x.rerank_score, reverse=True)
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self._record(intent, latency_ms)
+
+        stage_stats = {
+            "latency_ms": latency_ms,
+            "candidates": len(candidates),
+            "scored": len(missing),
+            "cached": len(candidates) - len(missing)
+        }
+        return candidates + rest, stage_stats
+
+    def _record(self, intent: str, latency_ms: float):
+        with self._stats_lock:
+            entry = self._latency.setdefault(intent, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["calls"] += 1
+            entry["total_ms"] += latency_ms
+            entry["max_ms"] = max(entry["max_ms"], latency_ms)
+
+    def stats(self) -> Dict:
+        """Latency theo intent + thống kê cache điểm"""
+        with self._stats_lock:
+            per_intent = {
+                intent: {
+                    "calls": e["calls"],
+                    "avg_ms": e["total_ms"] / e["calls"],
+                    "max_ms": e["max_ms"]
+                }
+                for intent, e in self._latency.items()
+            }
+        return {
+            "max_candidates": self.max_candidates,
+            "latency_by_intent": per_intent,
+            "score_cache": self.score_cache.stats()
+        }
@@ -1,13 +1,129 @@
 import chromadb
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
-from typing import List, Dict, Optional
+from app.core.cache import LRUCache
+from app.core.text_utils import normalize_query
+from app.core.collection_manifest import (
+    gc_retired_collections,
+    read_manifest,
+    resolve_collection_name
+)
+from app.models.search_hit import SearchHit
+from app.services.adaptive_depth import expand_depths, initial_depth
+from app.services.batch_encoder import BatchEncoder
+from app.services.encoder import load_encoder
+from app.services.diversify import gather_embeddings, mmr_diversify
+from app.services.vector_engine import create_vector_engine
+from app.services.lexical_index import CHUNK_FILES, LexicalIndex
+from app.services.keyword_matcher import KeywordMatch, KeywordMatcher
+from app.services.query_parser import ParsedQuery, parse_query
+from app.services.intent_router import PrototypeRouter
+from app.services.semantic_cache import SemanticCache
+from app.services.snapshot import open_snapshot, read_snapshot_version
+from app.services.rank_fusion import reciprocal_rank_fusion
+from app.services.reranker import CrossEncoderReranker
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
+from typing import Callable, List, Dict, Optional
+import asyncio
+import os
+import threading
+import time
 import numpy as np
 
+# Collections được search cho từng intent (intent "general" = tất cả)
+INTENT_COLLECTIONS = {
+    "product_search": ["products", "categories"],
+    "order_inquiry": ["order_guides", "policies", "faqs"],
+    "support": ["faqs", "policies"]
+}
+
+class QueryContext:
+    """
+    Biểu diễn query trong phạm vi một request
+
+    Query được encode đúng một lần, sau đó context này được truyền cho
+    mọi stage / collection trong pipeline search.
+    """
+    
+    def __init__(self, text: str, embedding: np.ndarray, generation: "IndexGeneration"):
+        self.text = text
+        self.text_lower = text.lower()
+        self.embedding = embedding
+        # Generation của index tại thời điểm request bắt đầu: mọi stage
+        # dùng cùng một bản, kể cả khi có hot reload giữa chừng
+        self.generation = generation
+        self.timed_out_collections: List[str] = []
+        self.keywords: Optional[KeywordMatch] = None
+        # Ràng buộc giá / size / danh mục và filter thực sự áp cho products
+        self.parsed: Optional[ParsedQuery] = None
+        self.product_filter: Optional[Dict] = None
+        
+        # Số candidates đã lấy / giữ lại theo collection (để tuning depth)
+        self.fetched: Dict[str, int] = {}
+        self.kept: Dict[str, int] = {}
+        self.retrieval_rounds = 0
+
+class IndexGeneration:
+    """
+    Mọi thứ phụ thuộc vào dữ liệu đã index, nạp cùng nhau từ một version
+    của collections manifest (và snapshot, nếu dùng)
+
+    SearchService swap cả generation bằng một phép gán; request đang chạy
+    giữ tham chiếu tới generation cũ (qua QueryContext) nên kết thúc trên
+    bản cũ, bản cũ được giải phóng khi không còn request nào dùng.
+    """
+    
+    def __init__(
+        self,
+        version: str,
+        collection_names: Dict[str, str],
+        collections: Dict,
+        vector_engine,
+        collection_sizes: Dict[str, int],
+        keyword_matcher: KeywordMatcher,
+        lexical_index: Optional[LexicalIndex],
+        router: Optional[PrototypeRouter],
+        snapshot=None
+    ):
+        self.version = version
+        self.collection_names = collection_names
+        self.collections = collections
+        self.vector_engine = vector_engine
+        self.collection_sizes = collection_sizes
+        self.keyword_matcher = keyword_matcher
+        self.lexical_index = lexical_index
+        self.router = router
+        self.snapshot = snapshot
+        self.loaded_at = time.time()
+
 class SearchService:
     def __init__(self):
-        self.model = SentenceTransformer(settings.MODEL_ENCODE)
-        self.client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
+        self.model = load_encoder(
+            settings.MODEL_ENCODE,
+            backend=settings.ENCODER_BACKEND,
+            max_seq_length=settings.ENCODER_MAX_SEQ_LENGTH,
+            num_threads=settings.ENCODER_NUM_THREADS,
+            export_root=settings.ENCODER_EXPORT_DIR,
+            quantization=settings.ENCODER_QUANTIZATION
+        )
+        self.batch_encoder = BatchEncoder(
+            self.model,
+            max_batch_size=settings.ENCODER_MAX_BATCH_SIZE,
+            max_wait_ms=settings.ENCODER_MAX_WAIT_MS,
+            timeout_ms=settings.ENCODER_TIMEOUT_MS
+        ) if settings.ENCODER_BATCHING else None
+        self.query_cache = LRUCache(
+            max_size=settings.QUERY_CACHE_SIZE,
+            ttl=settings.QUERY_CACHE_TTL
+        )
+        self.semantic_cache = SemanticCache(
+            max_size=settings.SEMANTIC_CACHE_SIZE,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            ttl=settings.SEMANTIC_CACHE_TTL,
+            version_provider=self._cache_version
+        ) if settings.SEMANTIC_CACHE else None
+        # Chroma client chỉ được mở khi cần (snapshot mmap không cần sqlite)
+        self.client = None
         
         # Định nghĩa các collections và trọng số
         self.collections_config = {
@@ -43,231 +159,1033 @@ class SearchService:
             }
         }
         
-        # Load collections
-        self.collections = {}
+        # Deadline (ms) cho từng collection, mặc định lấy từ settings
+        for config in self.collections_config.values():
+            config.setdefault("timeout_ms", settings.SEARCH_COLLECTION_TIMEOUT_MS)
+        
+        # Executor dùng chung để query các collections song song. Đủ worker
+        # cho mọi thread của index_executor cùng fan-out, để request async
+        # không xếp hàng sau nhau rồi hết deadline
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=max(
+                settings.SEARCH_MAX_WORKERS,
+                settings.ASYNC_SEARCH_WORKERS * len(self.collections_config)
+            ),
+            thread_name_prefix="collection-search"
+        )
+        
+        # Executors có giới hạn cho async API: event loop không bao giờ
+        # tự encode hay query index
+        self.encode_executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_ENCODE_WORKERS,
+            thread_name_prefix="query-encode"
+        )
+        self.index_executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_SEARCH_WORKERS,
+            thread_name_prefix="index-search"
+        )
+        
+        self._depth_lock = threading.Lock()
+        self.depth_stats: Dict[str, Dict[str, int]] = {}
+        
+        # Cross-encoder reranker (tùy chọn)
+        self.reranker = None
+        self.rerank_intents = {
+            i.strip() for i in settings.RERANK_INTENTS.split(",") if i.strip()
+        }
+        if settings.RERANK_MODEL:
+            try:
+                self.reranker = CrossEncoderReranker(
+                    settings.RERANK_MODEL,
+                    max_candidates=settings.RERANK_MAX_CANDIDATES,
+                    cache_size=settings.RERANK_CACHE_SIZE,
+                    cache_ttl=settings.RERANK_CACHE_TTL
+                )
+                print(f"✅ Loaded reranker: {settings.RERANK_MODEL}")
+            except Exception as e:
+                print(f"⚠️ Không thể load reranker {settings.RERANK_MODEL}: {e}")
+        
+        # Dữ liệu index thuộc về một generation; bản mới được nạp nền và
+        # swap atomic khi manifest / snapshot đổi version (xem _maybe_reload)
+        self._reload_lock = threading.Lock()
+        self._next_reload_check = time.monotonic() + settings.COLLECTION_RELOAD_INTERVAL
+        self.generation = self._load_generation()
+    
+    # ========================================================================
+    # INDEX GENERATIONS (hot reload)
+    # ========================================================================
+    
+    @property
+    def collections(self) -> Dict:
+        return self.generation.collections
+    
+    @property
+    def collection_names(self) -> Dict[str, str]:
+        return self.generation.collection_names
+    
+    @property
+    def collection_sizes(self) -> Dict[str, int]:
+        return self.generation.collection_sizes
+    
+    @property
+    def vector_engine(self):
+        return self.generation.vector_engine
+    
+    def _get_client(self):
+        if self.client is None:
+            self.client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
+        return self.client
+    
+    def _snapshot_enabled(self) -> bool:
+        return bool(settings.SNAPSHOT_DIR) and settings.VECTOR_ENGINE in ("faiss", "matrix")
+    
+    def _source_version(self) -> str:
+        """Version của dữ liệu nguồn: manifest (+ snapshot CURRENT)"""
+        version = str(read_manifest().get("version", "0"))
+        if self._snapshot_enabled():
+            version += f":{read_snapshot_version(settings.SNAPSHOT_DIR)}"
+        return version
+    
+    def _cache_version(self) -> str:
+        # Manifest đổi -> generation mới -> cache kết quả cũ tự hết hiệu lực
+        generation = getattr(self, "generation", None)
+        return generation.version if generation else ""
+    
+    def _load_generation(self) -> IndexGeneration:
+        """
+        Nạp collections + engine + BM25 + keyword / router theo manifest hiện tại
+        """
+        version = self._source_version()
+        manifest = read_manifest()
+        
+        # Snapshot mmap: worker không cần mở Chroma (sqlite) để search
+        snapshot = open_snapshot(settings.SNAPSHOT_DIR) if self._snapshot_enabled() else None
+        
+        collection_names = {}
+        collections = {}
         for key, config in self.collections_config.items():
-            if config["enabled"]:
+            if not config["enabled"]:
+                continue
+            name = resolve_collection_name(key, manifest)
+            if snapshot is not None:
+                if key in snapshot:
+                    collections[key] = None  # Dữ liệu nằm trong snapshot
+                    collection_names[key] = name
+                    print(f"✅ Loaded collection từ snapshot: {name}")
+                else:
+                    print(f"⚠️ Snapshot không có collection {name}")
+                continue
+            try:
+                collections[key] = self._get_client().get_collection(name)
+                collection_names[key] = name
+                print(f"✅ Loaded collection: {name}")
+            except Exception as e:
+                print(f"⚠️ Không thể load collection {name}: {e}")
+        
+        vector_engine = create_vector_engine(
+            settings.VECTOR_ENGINE,
+            collections,
+            weights={k: c["weight"] for k, c in self.collections_config.items()},
+            snapshot=snapshot
+        )
+        print(f"✅ Vector engine: {vector_engine.name}")
+        
+        # Kích thước từng collection cho adaptive retrieval depth
+        collection_sizes = {}
+        for key in collections:
+            try:
+                collection_sizes[key] = vector_engine.count(key)
+            except Exception as e:
+                print(f"⚠️ Không thể đếm collection {key}: {e}")
+                collection_sizes[key] = 0
+        
+        # Automaton keyword cho intent + product terms (kèm tên danh mục)
+        keyword_matcher = KeywordMatcher.from_category_file(
+            os.path.join(settings.CHUNKS_DIR, CHUNK_FILES["categories"])
+        )
+        
+        # BM25 và router dựng từ chính documents đang được index (không
+        # phải chunk JSON) nên luôn khớp với vectors của generation này
+        indexed_documents = {}
+        if settings.HYBRID_SEARCH or settings.ROUTER_ENABLED:
+            for key in collections:
                 try:
-                    self.collections[key] = self.client.get_collection(config["name"])
-                    print(f"✅ Loaded collection: {config['name']}")
+                    indexed_documents[key] = vector_engine.export_documents(key)
                 except Exception as e:
-                    print(f"⚠️ Không thể load collection {config['name']}: {e}")
+                    print(f"⚠️ Không thể đọc documents của {key}: {e}")
+        
+        # BM25 index cho hybrid retrieval (lexical + dense)
+        lexical_index = None
+        if settings.HYBRID_SEARCH:
+            lexical_index = LexicalIndex(
+                indexed_documents,
+                k1=settings.BM25_K1,
+                b=settings.BM25_B
+            )
+        
+        # Router intent/collection theo embedding prototypes
+        router = None
+        if settings.ROUTER_ENABLED:
+            router = self._build_router(vector_engine, indexed_documents)
+        
+        return IndexGeneration(
+            version=version,
+            collection_names=collection_names,
+            collections=collections,
+            vector_engine=vector_engine,
+            collection_sizes=collection_sizes,
+            keyword_matcher=keyword_matcher,
+            lexical_index=lexical_index,
+            router=router,
+            snapshot=snapshot
+        )
+    
+    def _maybe_reload(self):
+        """
+        Kiểm tra (tối đa mỗi COLLECTION_RELOAD_INTERVAL giây) xem manifest
+        có version mới không; nếu có thì nạp generation mới ở thread nền,
+        request hiện tại vẫn chạy trên generation cũ
+        """
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + settings.COLLECTION_RELOAD_INTERVAL
+        
+        try:
+            version = self._source_version()
+        except Exception as e:
+            print(f"⚠️ Không thể đọc version của index: {e}")
+            return
+        if version == self.generation.version or self._reload_lock.locked():
+            return
+        
+        threading.Thread(
+            target=self.reload, name="index-reload", daemon=True
+        ).start()
+    
+    def reload(self) -> bool:
+        """
+        Nạp generation mới và swap atomic, trả về True nếu đã swap
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            old = self.generation
+            started = time.monotonic()
+            generation = self._load_generation()
+            if generation.version == old.version:
+                return False
+            
+            self.generation = generation  # Swap: request mới dùng bản mới
+            print(
+                f"🔄 Đã chuyển index {old.version} -> {generation.version} "
+                f"({time.monotonic() - started:.1f}s)"
+            )
+            
+            # Xóa các collection đã retired quá grace period
+            if self.client is not None:
+                gc_retired_collections(self.client)
+            return True
+        except Exception as e:
+            print(f"❌ Reload index thất bại, giữ bản cũ: {e}")
+            return False
+        finally:
+            self._reload_lock.release()
+    
+    def _build_router(
+        self,
+        vector_engine,
+        indexed_documents: Dict[str, List[Dict]]
+    ) -> Optional[PrototypeRouter]:
+        """
+        Tính centroids từ vector (đã lưu trong index) của các document trong chunk JSON
+        """
+        try:
+            collection_embeddings = {
+                coll_key: vector_engine.get_embeddings(
+                    coll_key, [doc["id"] for doc in docs]
+                )
+                for coll_key, docs in indexed_documents.items()
+                if docs
+            }
+            return PrototypeRouter(
+                collection_embeddings,
+                INTENT_COLLECTIONS,
+                min_similarity=settings.ROUTER_MIN_SIMILARITY,
+                intent_margin=settings.ROUTER_INTENT_MARGIN,
+                collection_margin=settings.ROUTER_COLLECTION_MARGIN
+            )
+        except Exception as e:
+            print(f"⚠️ Không thể build intent router: {e}")
+            return None
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Encode query thành vector đã normalize (float32)
+
+        Kết quả được cache theo query đã chuẩn hóa (whitespace/case), nhưng
+        model vẫn encode query gốc như lúc chưa có cache.
+        """
+        cache_key = normalize_query(query)
+        embedding = self.query_cache.get(cache_key)
+        if embedding is not None:
+            return embedding
+        return self._cache_embedding(cache_key, self._encode_uncached(query))
+    
+    def _encode_uncached(self, query: str) -> np.ndarray:
+        if self.batch_encoder is not None:
+            return self.batch_encoder.encode(query)
+        return self.model.encode(
+            query,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype(np.float32)
+    
+    def _cache_embedding(self, cache_key: str, embedding: np.ndarray) -> np.ndarray:
+        embedding.setflags(write=False)  # Dùng chung giữa các request
+        self.query_cache.set(cache_key, embedding)
+        return embedding
+    
+    def encode_queries(self, queries: List[str]) -> List[np.ndarray]:
+        """
+        Encode nhiều query, các query chưa có trong cache được encode
+        chung một lần model.encode
+        """
+        keys = [normalize_query(q) for q in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        
+        # cache key -> query gốc đầu tiên có key đó (model encode query gốc)
+        missing = {}
+        for query, key, embedding in zip(queries, keys, embeddings):
+            if embedding is None and key not in missing:
+                missing[key] = query
+        if missing:
+            encoded = self.model.encode(
+                list(missing.values()),
+                batch_size=settings.ENCODER_MAX_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            ).astype(np.float32)
+            fresh = {}
+            for key, embedding in zip(missing, encoded):
+                embedding.setflags(write=False)
+                self.query_cache.set(key, embedding)
+                fresh[key] = embedding
+            embeddings = [
+                fresh[key] if embedding is None else embedding
+                for key, embedding in zip(keys, embeddings)
+            ]
+        
+        return embeddings
+    
+    def warm_up(self, query: str = "áo thun"):
+        """
+        Encode + query giả để load weights, khởi tạo session / index và
+        page-in dữ liệu trước khi nhận traffic thật
+        """
+        started = time.monotonic()
+        self.search(query, n_results=1, query_embedding=self.encode_query(query))
+        print(f"🔥 Warm-up search xong trong {(time.monotonic() - started) * 1000:.0f}ms")
+    
+    def shutdown(self):
+        """Đóng các executor (gọi khi app tắt), task đang chờ bị hủy"""
+        for executor in (self.search_executor, self.encode_executor, self.index_executor):
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    # ========================================================================
+    # ASYNC API
+    # ========================================================================
+    
+    async def aencode_query(self, query: str) -> np.ndarray:
+        """
+        encode_query không chặn event loop (cache hit trả về ngay)
+
+        Với micro-batching, request chờ Future của batch ngay trên event
+        loop: mọi query đang chờ đều vào được cùng batch thay vì bị giới hạn
+        bởi số thread của encode_executor.
+        """
+        cache_key = normalize_query(query)
+        embedding = self.query_cache.get(cache_key)
+        if embedding is not None:
+            return embedding
+        
+        if self.batch_encoder is not None:
+            embedding = await asyncio.wait_for(
+                asyncio.wrap_future(self.batch_encoder.submit(query)),
+                self.batch_encoder.timeout
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            embedding = await loop.run_in_executor(
+                self.encode_executor, self._encode_uncached, query
+            )
+        return self._cache_embedding(cache_key, embedding)
+    
+    async def asearch(
+        self,
+        query: str,
+        n_results: int = 5,
+        collections: Optional[List[str]] = None,
+        filter_metadata: Optional[Dict] = None,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> List[SearchHit]:
+        """
+        Bản async của search: encode qua batch encoder / encode_executor,
+        query index trên index_executor
+        """
+        if query_embedding is None:
+            query_embedding = await self.aencode_query(query)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.index_executor,
+            partial(
+                self.search,
+                query,
+                n_results,
+                collections=collections,
+                filter_metadata=filter_metadata,
+                query_embedding=query_embedding
+            )
+        )
+    
+    async def asmart_search(
+        self,
+        query: str,
+        n_results: int = 20,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> Dict:
+        """
+        Bản async của smart_search
+        """
+        if query_embedding is None:
+            query_embedding = await self.aencode_query(query)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.index_executor,
+            partial(self.smart_search, query, n_results, query_embedding=query_embedding)
+        )
+    
+    async def asearch_batch(
+        self,
+        queries: List[Dict],
+        collections: Optional[List[str]] = None
+    ) -> List[List[SearchHit]]:
+        """
+        Bản async của search_batch
+        """
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(
+            self.encode_executor,
+            self.encode_queries,
+            [q["query"] for q in queries]
+        )
+        return await loop.run_in_executor(
+            self.index_executor,
+            partial(self.search_batch, queries, collections, embeddings)
+        )
+    
+    def get_stats(self) -> Dict:
+        """
+        Thống kê runtime của search service
+        """
+        generation = self.generation
+        stats = {
+            "vector_engine": generation.vector_engine.name,
+            "index_version": generation.version,
+            "collections": generation.collection_names,
+            "query_cache": self.query_cache.stats()
+        }
+        if self.batch_encoder is not None:
+            stats["batch_encoder"] = self.batch_encoder.stats()
+        if self.semantic_cache is not None:
+            stats["semantic_cache"] = self.semantic_cache.stats()
+        if self.reranker is not None:
+            stats["reranker"] = self.reranker.stats()
+        with self._depth_lock:
+            stats["retrieval_depth"] = {
+                coll_key: dict(entry) for coll_key, entry in self.depth_stats.items()
+            }
+        return stats
+    
+    def build_query_context(
+        self,
+        query: str,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> QueryContext:
+        """
+        Tạo QueryContext cho một request - chỉ encode nếu chưa có vector
+        """
+        self._maybe_reload()
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
+        return QueryContext(
+            query, np.asarray(query_embedding, dtype=np.float32), self.generation
+        )
     
     def search(
         self,
         query: str,
         n_results: int = 5,
         collections: Optional[List[str]] = None,
-        filter_metadata: Optional[Dict] = None
-    ) -> List[Dict]:
-        
-        # Encode query
-        query_embedding = self.model.encode(
-            query,
-            convert_to_numpy=True,
-            normalize_embeddings=True
-        ).tolist()
+        filter_metadata: Optional[Dict] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        context: Optional[QueryContext] = None,
+        fetch_documents: bool = True
+    ) -> List[SearchHit]:
+        """
+        Search trên các collections
+
+        Có thể truyền sẵn query_embedding hoặc context (QueryContext) để
+        không phải encode lại query.
+
+        Retrieval 2 phase: chấm điểm + merge chỉ với ids/distances/metadata,
+        sau đó mới đọc text cho top-k còn lại. fetch_documents=False để
+        caller tự đọc text sau khi merge thêm (xem smart_search).
+        """
+        owns_context = context is None
+        if owns_context:
+            context = self.build_query_context(query, query_embedding)
+        generation = context.generation
         
         # Nếu không chỉ định collections, search all
         if collections is None:
-            collections = list(self.collections.keys())
+            collections = list(generation.collections.keys())
+        collections = [c for c in collections if c in generation.collections]
         
-        all_results = []
+        # Engine một ma trận: top-k toàn cục trong một lần tính, không fan-out
+        if generation.vector_engine.supports_global_search:
+            results = generation.vector_engine.search_all(
+                context.embedding.reshape(1, -1),
+                n_results,
+                collections,
+                filter_metadata
+            )[0]  # Text đã có sẵn trong RAM
+            for hit in results:
+                context.fetched[hit.collection] = context.fetched.get(hit.collection, 0) + 1
+            if owns_context:
+                self._record_depth(context, results)
+            return results
         
-        # Search từng collection
-        for coll_key in collections:
-            if coll_key not in self.collections:
-                continue
+        # Query các collections song song, mỗi collection có deadline riêng.
+        # Depth mỗi collection bắt đầu nhỏ và chỉ mở rộng khi còn có thể
+        # đóng góp vào top-k (xem adaptive_depth.expand_depths)
+        started = time.monotonic()
+        sizes = generation.collection_sizes
+        depths = {c: self._initial_depth(c, n_results, sizes) for c in collections}
+        hits_by_collection: Dict[str, List[SearchHit]] = {}
+        pending = [c for c in collections if depths[c] > 0]
+        
+        deadlines = {
+            c: started + self.collections_config[c]["timeout_ms"] / 1000 for c in collections
+        }
+        
+        # Đếm vòng theo từng lần gọi search: một request có thể gọi search
+        # nhiều lần (relax filter, categories), mỗi lần đều được mở rộng depth
+        rounds = 0
+        while pending:
+            rounds += 1
+            context.retrieval_rounds += 1
+            futures = self._fan_out(
+                {
+                    coll_key: partial(
+                        self._query_collection,
+                        generation,
+                        coll_key,
+                        context.embedding,
+                        depths[coll_key],
+                        filter_metadata
+                    )
+                    for coll_key in pending
+                }
+            )
             
-            collection = self.collections[coll_key]
-            weight = self.collections_config[coll_key]["weight"]
+            completed = []
+            for coll_key, future in futures.items():
+                try:
+                    hits = future.result(
+                        timeout=max(0.0, deadlines[coll_key] - time.monotonic())
+                    )
+                    # Vòng sau lấy lại cả candidates của vòng trước: chỉ cộng phần mới
+                    new = len(hits) - len(hits_by_collection.get(coll_key, ()))
+                    hits_by_collection[coll_key] = hits
+                    context.fetched[coll_key] = context.fetched.get(coll_key, 0) + max(0, new)
+                    completed.append(coll_key)
+                except FutureTimeoutError:
+                    # Collection chậm bị loại khỏi merge thay vì chặn cả câu trả lời
+                    # (nếu đã có kết quả từ vòng trước thì vẫn giữ)
+                    future.cancel()
+                    context.timed_out_collections.append(coll_key)
+                    print(f"⏱️ Collection {coll_key} quá deadline, bỏ qua")
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi search collection {coll_key}: {e}")
             
-            try:
-                # Query collection với n_results lớn hơn để có pool tốt hơn
-                results = collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=n_results * 3,  # ✅ TĂNG GẤP 3 để có nhiều candidates
-                    where=filter_metadata,
-                    include=["documents", "metadatas", "distances"]
+            if rounds >= settings.ADAPTIVE_MAX_ROUNDS:
+                break
+            pending = expand_depths(
+                completed, hits_by_collection, depths, n_results, sizes
+            )
+        
+        all_results = [hit for hits in hits_by_collection.values() for hit in hits]
+        
+        # Sort theo weighted_score
+        all_results.sort(key=lambda x: x.weighted_score, reverse=True)
+        all_results = all_results[:n_results]
+        
+        if fetch_documents:
+            self._fetch_documents(generation, all_results)
+        if owns_context:
+            self._record_depth(context, all_results)
+        
+        return all_results
+    
+    def _initial_depth(self, coll_key: str, n_results: int, sizes: Dict[str, int]) -> int:
+        """Số candidates ban đầu cho một collection (xem adaptive_depth)"""
+        return initial_depth(
+            self.collections_config[coll_key]["weight"],
+            n_results,
+            sizes.get(coll_key, 0),
+            settings.ADAPTIVE_MIN_DEPTH,
+            settings.ADAPTIVE_DEPTH_FACTOR
+        )
+    
+    def _record_depth(self, context: QueryContext, results: List[SearchHit]):
+        """
+        Ghi nhận candidates đã lấy vs giữ lại theo collection
+        """
+        for hit in results:
+            context.kept[hit.collection] = context.kept.get(hit.collection, 0) + 1
+        
+        with self._depth_lock:
+            for coll_key in set(context.fetched) | set(context.kept):
+                entry = self.depth_stats.setdefault(
+                    coll_key, {"queries": 0, "fetched": 0, "kept": 0}
                 )
-                
-                # Parse results
-                if results and results['ids'] and len(results['ids'][0]) > 0:
-                    for i, doc_id in enumerate(results['ids'][0]):
-                        all_results.append({
-                            "id": doc_id,
-                            "text": results['documents'][0][i],
-                            "metadata": results['metadatas'][0][i],
-                            "distance": results['distances'][0][i],
-                            "collection": coll_key,
-                            "weighted_score": (1 - results['distances'][0][i]) * weight,
-                            "raw_score": 1 - results['distances'][0][i]  # ✅ LƯU raw score để debug
-                        })
-            
+                entry["queries"] += 1
+                entry["fetched"] += context.fetched.get(coll_key, 0)
+                entry["kept"] += context.kept.get(coll_key, 0)
+    
+    def _fetch_documents(self, generation: IndexGeneration, results: List[SearchHit]):
+        """
+        Phase 2: đọc text (bulk, theo collection) cho các kết quả chưa có text
+        """
+        missing = {}
+        for result in results:
+            if result.text is None:
+                missing.setdefault(result.collection, []).append(result.id)
+        
+        for coll_key, ids in missing.items():
+            try:
+                documents = generation.vector_engine.fetch_documents(coll_key, ids)
             except Exception as e:
-                print(f"⚠️ Lỗi khi search collection {coll_key}: {e}")
+                print(f"⚠️ Lỗi khi đọc documents của {coll_key}: {e}")
+                documents = {}
+            for result in results:
+                if result.collection == coll_key and result.text is None:
+                    result.text = documents.get(result.id, "")
+    
+    def _fan_out(self, jobs: Dict[str, Callable]) -> Dict[str, Future]:
+        """
+        Submit các job lên search_executor; caller chờ từng Future với
+        deadline của collection tương ứng (không bao giờ tự chạy job)
+        """
+        return {key: self.search_executor.submit(fn) for key, fn in jobs.items()}
+    
+    def _query_collection(
+        self,
+        generation: IndexGeneration,
+        coll_key: str,
+        query_embedding: np.ndarray,
+        n_candidates: int,
+        filter_metadata: Optional[Dict] = None
+    ) -> List[SearchHit]:
+        """
+        Query một collection qua vector engine và tính weighted score
+        """
+        return self._query_collection_batch(
+            generation, coll_key, query_embedding.reshape(1, -1), n_candidates, filter_metadata
+        )[0]
+    
+    def _query_collection_batch(
+        self,
+        generation: IndexGeneration,
+        coll_key: str,
+        query_embeddings: np.ndarray,
+        n_candidates: int,
+        filter_metadata: Optional[Dict] = None
+    ) -> List[List[SearchHit]]:
+        """
+        Query một collection với nhiều vector (Q, D) trong một lần gọi engine
+        """
+        weight = self.collections_config[coll_key]["weight"]
         
-        # Sort theo weighted_score
-        all_results.sort(key=lambda x: x['weighted_score'], reverse=True)
+        hits_per_query = generation.vector_engine.query(
+            coll_key,
+            query_embeddings,
+            n_candidates,
+            filter_metadata
+        )
         
-        return all_results[:n_results]
+        for hits in hits_per_query:
+            for hit in hits:
+                hit.raw_score = 1 - hit.distance  # ✅ LƯU raw score để debug
+                hit.weighted_score = hit.raw_score * weight
+        
+        return hits_per_query
     
-    def smart_search(self, query: str, n_results: int = 20) -> Dict:  # ✅ TĂNG default từ 50 → 20
+    def search_batch(
+        self,
+        queries: List[Dict],
+        collections: Optional[List[str]] = None,
+        embeddings: Optional[List[np.ndarray]] = None
+    ) -> List[List[SearchHit]]:
+        """
+        Search nhiều query trong một lần
+
+        Mỗi phần tử của queries: {"query", "n_results", "filter_metadata"}.
+        Các query chưa có trong cache được encode bằng một lần model.encode;
+        các query cùng filter được gộp thành một ma trận (Q, D) và chỉ gọi
+        engine một lần cho mỗi collection. Kết quả trả về theo thứ tự input.
+        """
+        if not queries:
+            return []
+        
+        self._maybe_reload()
+        generation = self.generation
+        
+        if collections is None:
+            collections = list(generation.collections.keys())
+        collections = [c for c in collections if c in generation.collections]
+        
+        if embeddings is None:
+            embeddings = self.encode_queries([q["query"] for q in queries])
+        
+        # Gộp theo filter: mỗi nhóm dùng chung một where cho engine
+        groups: Dict[str, List[int]] = {}
+        for i, q in enumerate(queries):
+            groups.setdefault(repr(q.get("filter_metadata")), []).append(i)
+        
+        results: List[List[SearchHit]] = [[] for _ in queries]
+        for positions in groups.values():
+            where = queries[positions[0]].get("filter_metadata")
+            n_results = max(queries[i].get("n_results", 5) for i in positions)
+            matrix = np.stack([embeddings[i] for i in positions])
+            
+            if generation.vector_engine.supports_global_search:
+                group_hits = generation.vector_engine.search_all(
+                    matrix, n_results, collections, where
+                )
+            else:
+                group_hits = [[] for _ in positions]
+                futures = self._fan_out({
+                    coll_key: partial(
+                        self._query_collection_batch,
+                        generation,
+                        coll_key,
+                        matrix,
+                        n_results,
+                        where
+                    )
+                    for coll_key in collections
+                })
+                for coll_key, future in futures.items():
+                    try:
+                        for row, hits in enumerate(future.result()):
+                            group_hits[row].extend(hits)
+                    except Exception as e:
+                        print(f"⚠️ Lỗi khi search collection {coll_key}: {e}")
+            
+            for row, i in enumerate(positions):
+                hits = sorted(group_hits[row], key=lambda x: x.weighted_score, reverse=True)
+                results[i] = hits[:queries[i].get("n_results", 5)]
+        
+        # Đọc text một lần cho mọi query
+        self._fetch_documents(generation, [hit for hits in results for hit in hits])
+        return results
+    
+    def smart_search(
+        self,
+        query: str,
+        n_results: int = 20,  # ✅ TĂNG default từ 50 → 20
+        query_embedding: Optional[np.ndarray] = None
+    ) -> Dict:
         """
         Smart search với intent classification và adaptive retrieval
+
+        Query chỉ được encode MỘT lần ở đây, sau đó QueryContext được
+        truyền xuống mọi stage / collection.
         """
-        query_lower = query.lower()
+        context = self.build_query_context(query, query_embedding)
+        generation = context.generation
+        
+        # Một lượt quét automaton: điểm intent + product terms
+        context.keywords = generation.keyword_matcher.match(context.text_lower)
+        # Giá / size / danh mục -> metadata filter cho products
+        context.parsed = parse_query(context.text, context.keywords.categories)
+        
+        # Semantic cache: câu hỏi gần trùng ý với câu đã trả lời.
+        # "dưới 300k" và "dưới 500k" (hay "áo" và "quần") gần như cùng vector
+        # nên ràng buộc + product terms + danh mục phải nằm trong key
+        cache_key = (
+            n_results,
+            repr(context.parsed.to_dict()),
+            tuple(sorted(set(context.keywords.product_terms))),
+            tuple(sorted(set(context.keywords.categories)))
+        )
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.get(context.embedding, cache_key)
+            if cached is not None:
+                return self._copy_search_result(cached, query, cache_hit=True)
         
         # Phân loại intent
-        intent = self._classify_intent(query_lower)
+        intent = self._classify_intent(context.keywords)
+        routed_by = "keywords"
+        
+        # Query mơ hồ: route bằng vector query đã có (không encode thêm)
+        if intent == "general" and generation.router is not None:
+            routed = generation.router.route_intent(context.embedding)
+            if routed is not None:
+                intent = routed[0]
+                routed_by = "embedding"
+        
+        # ✅ ADAPTIVE SEARCH: Tùy intent mà điều chỉnh strategy
+        collections = INTENT_COLLECTIONS.get(intent)
+        if collections is None:
+            # General search: bỏ các collections không thể đóng góp
+            collections = list(generation.collections.keys())
+            if generation.router is not None:
+                collections = generation.router.select_collections(
+                    context.embedding, collections
+                )
+        
+        # Cross-encoder cần pool rộng hơn n_results mới đổi được kết quả
+        # cuối cùng: giữ tới RERANK_MAX_CANDIDATES qua fusion / MMR, rerank
+        # rồi mới cắt về n_results
+        rerank = self.reranker is not None and intent in self.rerank_intents
+        keep = max(n_results, settings.RERANK_MAX_CANDIDATES) if rerank else n_results
+        # Khi diversify: lấy + fuse một pool rộng hơn để MMR chọn keep kết
+        # quả (bù được các near-duplicate bị loại)
+        pool_size = max(keep, n_results * settings.MMR_POOL_FACTOR) if settings.DIVERSIFY else keep
         
         results = {
             "intent": intent,
             "query": query,
-            "results": []
+            "results": [],
+            "routed_by": routed_by,
+            "searched_collections": collections,
+            "timed_out_collections": context.timed_out_collections
         }
         
-        # ✅ ADAPTIVE SEARCH: Tùy intent mà điều chỉnh strategy
         if intent == "product_search":
             # Với product search, cần nhiều kết quả hơn
-            results["results"] = self._product_focused_search(query, n_results)
-            
-        elif intent == "order_inquiry":
+            results["results"] = self._product_focused_search(context, pool_size)
+            if context.parsed.has_constraints:
+                results["filters"] = context.parsed.to_dict()
+                results["applied_filter"] = context.product_filter
+        else:
             results["results"] = self.search(
-                query, n_results, collections=["order_guides", "policies", "faqs"]
+                query, pool_size, collections=collections,
+                context=context, fetch_documents=False
             )
-            
-        elif intent == "support":
-            results["results"] = self.search(
-                query, n_results, collections=["faqs", "policies"]
+        
+        # ✅ RERANKING: Hybrid lexical (BM25) + dense
+        results["results"] = self._rerank_results(
+            context, results["results"], collections, pool_size
+        )
+        
+        # Bỏ các chunks nói cùng một ý (trước khi đọc text)
+        if settings.DIVERSIFY:
+            results["results"] = self._diversify(generation, results["results"], keep)
+        results["results"] = results["results"][:keep]
+        
+        # Phase 2: chỉ đọc text cho các kết quả còn lại sau merge + fusion
+        self._fetch_documents(generation, results["results"])
+        
+        # Cross-encoder rerank (chỉ với các intent được bật)
+        if rerank:
+            reranked, results["rerank"] = self.reranker.rerank(
+                query, results["results"], intent, index_version=generation.version
             )
-        else:
-            # General search
-            results["results"] = self.search(query, n_results)
+            results["results"] = reranked[:n_results]
         
-        # ✅ RERANKING: Đảm bảo kết quả tốt nhất lên đầu
-        results["results"] = self._rerank_results(query, results["results"])
+        self._record_depth(context, results["results"])
+        results["retrieval"] = {
+            "rounds": context.retrieval_rounds,
+            "fetched": context.fetched,
+            "kept": context.kept
+        }
+        results["semantic_cache_hit"] = False
+        
+        # Không cache kết quả thiếu collection do timeout
+        if self.semantic_cache is not None and not context.timed_out_collections:
+            self.semantic_cache.set(
+                context.embedding, cache_key, self._copy_search_result(results, query)
+            )
         
         return results
     
-    def _product_focused_search(self, query: str, n_results: int) -> List[Dict]:
+    def _copy_search_result(self, result: Dict, query: str, cache_hit: bool = False) -> Dict:
+        """
+        Bản sao nông của kết quả smart_search (để cache không bị sửa từ bên ngoài)
+        """
+        copied = dict(result)
+        copied["query"] = query
+        copied["results"] = [r.copy() for r in result["results"]]
+        copied["timed_out_collections"] = list(result["timed_out_collections"])
+        copied["semantic_cache_hit"] = cache_hit
+        return copied
+    
+    def _product_focused_search(self, context: QueryContext, n_results: int) -> List[SearchHit]:
         """
         ✅ MỚI: Search tập trung vào products với multi-stage retrieval
         """
         all_results = []
         
-        # Stage 1: Search products trực tiếp
-        product_results = self.search(
-            query, 
-            n_results=n_results,  # Lấy nhiều products
-            collections=["products"]
-        )
+        # Stage 1: Search products trực tiếp, lọc theo giá / size / danh mục
+        # trong query. Filter được nới dần nếu không còn sản phẩm nào khớp.
+        filters = context.parsed.relaxed_filters() if context.parsed else [None]
+        for where in filters:
+            product_results = self.search(
+                context.text, 
+                n_results=n_results,  # Lấy nhiều products
+                collections=["products"],
+                filter_metadata=where,
+                context=context,
+                fetch_documents=False
+            )
+            if product_results:
+                context.product_filter = where
+                break
         all_results.extend(product_results)
         
         # Stage 2: Search categories để có context về nhóm sản phẩm
+        # (dùng lại vector đã encode ở stage 1)
         category_results = self.search(
-            query,
+            context.text,
             n_results=max(3, n_results // 4),  # Lấy ít categories hơn
-            collections=["categories"]
+            collections=["categories"],
+            context=context,
+            fetch_documents=False
         )
         all_results.extend(category_results)
         
         # Merge và sort lại
-        all_results.sort(key=lambda x: x['weighted_score'], reverse=True)
+        all_results.sort(key=lambda x: x.weighted_score, reverse=True)
         
         return all_results[:n_results]
     
-    def _rerank_results(self, query: str, results: List[Dict]) -> List[Dict]:
+    def _rerank_results(
+        self,
+        context: QueryContext,
+        results: List[SearchHit],
+        collections: Optional[List[str]],
+        n_results: int
+    ) -> List[SearchHit]:
         """
-        ✅ MỚI: Rerank kết quả dựa trên semantic similarity và relevance
+        Hybrid retrieval: fuse ranking dense với ranking BM25 bằng
+        reciprocal-rank fusion (RRF)
+
+        fused_score = Σ 1 / (RRF_K + rank) trên các ranking chứa document.
+        Kết quả chỉ có ở phía lexical cũng được đưa vào danh sách.
+        Khi tắt HYBRID_SEARCH: boost theo keyword như trước (xem
+        _keyword_boost).
+        """
+        if context.generation.lexical_index is None:
+            return self._keyword_boost(context, results)
+        
+        return reciprocal_rank_fusion(
+            results,
+            self._lexical_search(context, collections, n_results),
+            n_results,
+            rrf_k=settings.RRF_K,
+            boost_products=context.keywords is not None and bool(context.keywords.product_terms)
+        )
+    
+    def _keyword_boost(
+        self,
+        context: QueryContext,
+        results: List[SearchHit]
+    ) -> List[SearchHit]:
+        """
+        Rerank không có BM25: +0.1 weighted_score cho mỗi product term của
+        query xuất hiện trong text, +0.05 cho products khi query là
+        product-related
         """
         if len(results) <= 1:
             return results
         
-        query_lower = query.lower()
-        
-        # Extract keywords từ query
-        product_keywords = self._extract_product_keywords(query_lower)
+        if context.keywords is None or not context.keywords.product_terms:
+            return results
+        product_terms = list(dict.fromkeys(context.keywords.product_terms))
         
-        # Rerank dựa trên keyword matching
+        # Cần text để match: đọc trước (phase 2 sẽ bỏ qua các hit đã có text)
+        self._fetch_documents(context.generation, results)
         for result in results:
-            boost_score = 0.0
-            text_lower = result['text'].lower()
-            
-            # Boost nếu match exact keywords
-            for keyword in product_keywords:
-                if keyword in text_lower:
-                    boost_score += 0.1
-            
-            # Boost products cao hơn khi query là product-related
-            if result['collection'] == 'products' and product_keywords:
-                boost_score += 0.05
-            
-            # Apply boost
-            result['weighted_score'] += boost_score
-        
-        # Sort lại
-        results.sort(key=lambda x: x['weighted_score'], reverse=True)
+            text_lower = (result.text or "").lower()
+            boost = sum(0.1 for term in product_terms if term in text_lower)
+            if result.collection == "products":
+                boost += 0.05
+            result.weighted_score += boost
         
+        results.sort(key=lambda x: x.weighted_score, reverse=True)
         return results
     
-    def _extract_product_keywords(self, query: str) -> List[str]:
+    def _diversify(
+        self,
+        generation: IndexGeneration,
+        results: List[SearchHit],
+        n_results: int
+    ) -> List[SearchHit]:
         """
-        ✅ MỚI: Extract product-related keywords từ query
+        MMR + near-duplicate trên embeddings của các kết quả đã merge
         """
-        product_terms = [
-            "áo", "quần", "giày", "váy", "đầm", "thun", "sơ mi", "khoác",
-            "jean", "kaki", "polo", "hoodie", "nỉ", "len", "dạ"
-        ]
-        
-        found_keywords = []
-        for term in product_terms:
-            if term in query:
-                found_keywords.append(term)
-        
-        return found_keywords
+        if len(results) <= 1:
+            return results
+        try:
+            embeddings = gather_embeddings(results, generation.vector_engine.get_embeddings)
+        except Exception as e:
+            print(f"⚠️ Lỗi khi đọc embeddings để diversify: {e}")
+            return results[:n_results]
+        return mmr_diversify(
+            results,
+            embeddings,
+            n_results,
+            lambda_=settings.MMR_LAMBDA,
+            duplicate_threshold=settings.DUPLICATE_THRESHOLD
+        )
     
-    def _classify_intent(self, query: str) -> str:
+    def _lexical_search(
+        self,
+        context: QueryContext,
+        collections: Optional[List[str]],
+        n_results: int
+    ) -> List[SearchHit]:
         """
-        ✅ CẢI TIẾN: Intent classification chính xác hơn
+        BM25 search; filter của products chỉ áp cho products collection
         """
-        # Keywords cho product search - MỞ RỘNG
-        product_keywords = [
-            "sản phẩm", "áo", "quần", "giày", "mua", "giá", "size", "màu",
-            "váy", "đầm", "shop", "bán", "có", "tìm", "mẫu", "loại",
-            "thun", "sơ mi", "khoác", "jean", "những", "nào", "gì"  # ✅ THÊM
-        ]
+        lexical_index = context.generation.lexical_index
+        where = context.product_filter
+        if where is None or (collections is not None and "products" not in collections):
+            return lexical_index.search(context.text, n_results, collections)
         
-        # Keywords cho order inquiry
-        order_keywords = [
-            "đơn hàng", "order", "giao hàng", "ship", "tracking", "trạng thái",
-            "hủy đơn", "đặt hàng", "mua hàng", "thanh toán"
+        others = [
+            c for c in (collections or context.generation.collections.keys())
+            if c != "products"
         ]
-        
-        # Keywords cho support
-        support_keywords = [
-            "làm sao", "như thế nào", "cách", "đổi trả", "hoàn tiền",
-            "chính sách", "bảo hành", "liên hệ", "hotline"
-        ]
-        
+        hits = lexical_index.search(context.text, n_results, ["products"], where)
+        if others:
+            hits.extend(lexical_index.search(context.text, n_results, others))
+            hits.sort(key=lambda x: x.lexical_score, reverse=True)
+        return hits[:n_results]
+    
+    def _classify_intent(self, keywords: KeywordMatch) -> str:
+        """
+        ✅ CẢI TIẾN: Intent classification chính xác hơn
+
+        Điểm mỗi intent = số keyword của intent đó xuất hiện trong query
+        (đếm bởi KeywordMatcher trong một lượt quét).
+        """
         # ✅ SCORING-BASED classification thay vì first-match
-        scores = {
-            "product_search": 0,
-            "order_inquiry": 0,
-            "support": 0
-        }
-        
-        for keyword in product_keywords:
-            if keyword in query:
-                scores["product_search"] += 1
-        
-        for keyword in order_keywords:
-            if keyword in query:
-                scores["order_inquiry"] += 1
-        
-        for keyword in support_keywords:
-            if keyword in query:
-                scores["support"] += 1
+        scores = keywords.intent_scores
         
         # Return intent với score cao nhất
         max_intent = max(scores, key=scores.get)
@@ -0,0 +1,147 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+import numpy as np
+
+class SemanticCache:
+    """
+    Cache kết quả smart_search theo embedding của query
+
+    Query mới trả về kết quả đã cache nếu cosine với một query đã cache
+    >= threshold (câu hỏi diễn đạt khác nhưng cùng ý). Lookup là nearest
+    neighbour exact bằng một phép matmul trên ma trận embeddings đã cache
+    (đủ nhanh với vài nghìn entries).
+
+    Chỉ so với các entry cùng key (tham số + ràng buộc của query): dict
+    key -> slots giữ các slot của từng key nên lookup chỉ matmul trên
+    các slot đó.
+
+    Toàn bộ cache bị xóa khi version_provider() đổi giá trị, tức là khi
+    collections được build lại.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        threshold: float = 0.95,
+        ttl: float = 600,
+        version_provider: Optional[Callable[[], str]] = None,
+        version_check_interval: float = 1.0
+    ):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self.version_provider = version_provider
+        self.version_check_interval = version_check_interval
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys = [None] * max_size
+        self._key_slots: Dict[Hashable, Set[int]] = {}
+        self._values = [None] * max_size
+        self._expires_at = np.zeros(max_size, dtype=np.float64)
+        self._last_used = np.zeros(max_size, dtype=np.float64)
+        self._valid = np.zeros(max_size, dtype=bool)
+
+        self._version = version_provider() if version_provider else None
+        self._version_checked_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self):
+        if self.version_provider is None:
+            return
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+
+        version = self.version_provider()
+        if version != self._version:
+            self._version = version
+            self._reset()
+            self.invalidations += 1
+
+    def _reset(self):
+        self._valid[:] = False
+        self._values = [None] * self.max_size
+        self._keys = [None] * self.max_size
+        self._key_slots = {}
+
+    def get(self, embedding: np.ndarray, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._check_version()
+            slots = self._key_slots.get(key)
+            if not slots:
+                self.misses += 1
+                return None
+
+            now = time.monotonic()
+            slots = np.fromiter(slots, dtype=np.int64, count=len(slots))
+            slots = slots[self._expires_at[slots] > now]
+            if not len(slots):
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[slots] @ embedding
+            i = int(np.argmax(similarities))
+            if similarities[i] < self.threshold:
+                self.misses += 1
+                return None
+
+            best = int(slots[i])
+            self._last_used[best] = now
+            self.hits += 1
+            return self._values[best]
+
+    def set(self, embedding: np.ndarray, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._check_version()
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, len(embedding)), dtype=np.float32)
+
+            free = np.flatnonzero(~self._valid)
+            if len(free):
+                slot = int(free[0])
+            else:
+                # Hết chỗ: thay entry ít dùng gần đây nhất
+                slot = int(np.argmin(self._last_used))
+                old_slots = self._key_slots[self._keys[slot]]
+                old_slots.discard(slot)
+                if not old_slots:
+                    del self._key_slots[self._keys[slot]]
+                self.evictions += 1
+
+            now = time.monotonic()
+            self._matrix[slot] = embedding
+            self._keys[slot] = key
+            self._key_slots.setdefault(key, set()).add(slot)
+            self._values[slot] = value
+            self._expires_at[slot] = now + self.ttl if self.ttl > 0 else np.inf
+            self._last_used[slot] = now
+            self._valid[slot] = True
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": int(self._valid.sum()),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,201 @@
+"""
+Snapshot embeddings dạng memory-mapped, dùng chung giữa các worker
+
+Một snapshot là một thư mục con của SNAPSHOT_DIR:
+
+- vectors.f32: float32 (N, D) của mọi collection, nối theo thứ tự manifest
+- records.bin + records.idx: JSON [id, metadata] từng document, idx là
+  uint64 (N + 1) offsets vào blob
+- documents.bin + documents.idx: text từng document, đọc lazy khi cần
+- manifest.json: dim, và {start, count} của từng collection
+
+File CURRENT trỏ tới snapshot đang dùng và được ghi atomic, nên worker
+mới luôn mở một snapshot hoàn chỉnh. Mọi file được mở read-only bằng
+mmap: N worker dùng chung page cache thay vì N bản vectors trong RAM, và
+không cần chạm sqlite của Chroma để bắt đầu search.
+"""
+
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.vector_engine import CollectionData
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+# Số snapshot cũ được giữ lại (worker cũ có thể vẫn đang mmap)
+KEEP_SNAPSHOTS = 2
+
+class MmapBlob:
+    """Danh sách bản ghi bytes trên mmap, decode khi truy cập"""
+
+    def __init__(self, data_path: str, index_path: str):
+        self.offsets = np.memmap(index_path, dtype=np.uint64, mode="r")
+        size = int(self.offsets[-1]) if len(self.offsets) else 0
+        self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if size else None
+
+    def __len__(self) -> int:
+        return max(0, len(self.offsets) - 1)
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        if start == end:
+            return ""
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def _write_blob(data_path: str, index_path: str, items: List[bytes]):
+    offsets = np.zeros(len(items) + 1, dtype=np.uint64)
+    with open(data_path, "wb") as f:
+        for i, item in enumerate(items):
+            f.write(item)
+            offsets[i + 1] = offsets[i] + len(item)
+    offsets.tofile(index_path)
+
+def write_snapshot(snapshot_dir: str, collections: Dict[str, CollectionData]) -> str:
+    """
+    Ghi snapshot mới rồi trỏ CURRENT tới nó, trả về đường dẫn snapshot
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = str(time.time_ns())
+    path = os.path.join(snapshot_dir, version)
+    os.makedirs(path)
+
+    dims = {data.embeddings.shape[1] for data in collections.values() if len(data)}
+    if len(dims) > 1:
+        raise ValueError(f"Các collection có số chiều khác nhau: {dims}")
+    dim = dims.pop() if dims else 0
+
+    manifest = {"version": version, "dim": dim, "collections": {}}
+    records, documents = [], []
+    start = 0
+    with open(os.path.join(path, "vectors.f32"), "wb") as f:
+        for coll_key, data in collections.items():
+            if len(data):
+                np.ascontiguousarray(data.embeddings, dtype=np.float32).tofile(f)
+            manifest["collections"][coll_key] = {"start": start, "count": len(data)}
+            start += len(data)
+            for doc_id, metadata, document in zip(data.ids, data.metadatas, data.documents):
+                records.append(json.dumps([doc_id, metadata], ensure_ascii=False).encode("utf-8"))
+                documents.append((document or "").encode("utf-8"))
+
+    _write_blob(os.path.join(path, "records.bin"), os.path.join(path, "records.idx"), records)
+    _write_blob(os.path.join(path, "documents.bin"), os.path.join(path, "documents.idx"), documents)
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    current = os.path.join(snapshot_dir, CURRENT_FILE)
+    with open(f"{current}.tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(f"{current}.tmp", current)
+
+    _remove_old_snapshots(snapshot_dir, version)
+    return path
+
+def _remove_old_snapshots(snapshot_dir: str, current: str):
+    versions = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if name.isdigit() and os.path.isdir(os.path.join(snapshot_dir, name))
+    )
+    for name in versions[:-KEEP_SNAPSHOTS]:
+        if name != current:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+class Snapshot:
+    """Snapshot đã mở (read-only, mmap)"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        self.path = path
+        self.version = manifest["version"]
+        self.dim = manifest["dim"]
+        self.collections: Dict[str, Dict[str, int]] = manifest["collections"]
+        total = sum(c["count"] for c in self.collections.values())
+
+        if total and self.dim:
+            self.vectors = np.memmap(
+                os.path.join(path, "vectors.f32"), dtype=np.float32,
+                mode="r", shape=(total, self.dim)
+            )
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.records = MmapBlob(
+            os.path.join(path, "records.bin"), os.path.join(path, "records.idx")
+        )
+        self.documents = MmapBlob(
+            os.path.join(path, "documents.bin"), os.path.join(path, "documents.idx")
+        )
+
+    def __contains__(self, coll_key: str) -> bool:
+        return coll_key in self.collections
+
+    def keys(self) -> List[str]:
+        return list(self.collections.keys())
+
+    def collection_data(self, coll_key: str) -> CollectionData:
+        """
+        CollectionData với embeddings là view trên mmap (không copy) và
+        documents đọc lazy từ blob
+        """
+        info = self.collections[coll_key]
+        start, end = info["start"], info["start"] + info["count"]
+
+        ids, metadatas = [], []
+        for i in range(start, end):
+            doc_id, metadata = json.loads(self.records[i])
+            ids.append(doc_id)
+            metadatas.append(metadata)
+
+        return CollectionData(
+            ids=ids,
+            embeddings=self.vectors[start:end],
+            metadatas=metadatas,
+            documents=_BlobSlice(self.documents, start, end)
+        )
+
+class _BlobSlice:
+    """View [start, end) của một MmapBlob"""
+
+    def __init__(self, blob: MmapBlob, start: int, end: int):
+        self.blob = blob
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.blob[self.start + i]
+
+def read_snapshot_version(snapshot_dir: str) -> str:
+    """Version mà CURRENT đang trỏ tới ("0" nếu chưa có snapshot)"""
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+def open_snapshot(snapshot_dir: str) -> Optional[Snapshot]:
+    """Mở snapshot mà CURRENT trỏ tới, None nếu chưa có"""
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        return Snapshot(os.path.join(snapshot_dir, version))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Không thể mở snapshot trong {snapshot_dir}: {e}")
+        return None
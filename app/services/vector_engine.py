@@ -0,0 +1,503 @@
+"""
+Vector engines cho SearchService
+
+- ChromaEngine: query trực tiếp qua chromadb (sqlite-backed)
+- FaissEngine: load embeddings/ids/metadata của từng collection vào
+  FAISS index in-process lúc khởi động
+- UnifiedMatrixEngine: một ma trận float32 duy nhất chứa mọi document của
+  mọi collection, top-k toàn cục bằng 1 matmul + argpartition
+
+Mọi engine trả về SearchHit (id, collection, metadata, distance, text) với
+distance theo chuẩn của Chroma (squared L2 mặc định). "text" có thể là None
+nếu engine để việc đọc document sang phase 2 (xem fetch_documents). Vì
+embeddings đã normalize nên squared L2 = 2 - 2 * cosine, nhờ đó
+weighted_score/raw_score tính ở SearchService không đổi khi chuyển engine.
+"""
+
+from typing import Dict, List, Optional
+import numpy as np
+
+from app.core.config import settings
+from app.models.search_hit import SearchHit
+from app.services.metadata_store import ColumnarMetadata
+
+def similarity_to_distance(similarity: np.ndarray) -> np.ndarray:
+    """Đổi inner product (cosine) sang squared L2 distance như Chroma"""
+    return 2.0 - 2.0 * similarity
+
+class CollectionData:
+    """Dữ liệu của một collection được giữ trong RAM"""
+
+    def __init__(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict],
+        documents: List[str]
+    ):
+        self.ids = ids
+        self.embeddings = embeddings
+        self.metadatas = metadatas
+        self.documents = documents
+        self.columns = ColumnarMetadata(metadatas)
+        self.id_index = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+def _gather_rows(matrix: np.ndarray, positions: List[Optional[int]], dim: int) -> np.ndarray:
+    """Lấy các hàng theo vị trí, vị trí None -> vector 0"""
+    rows = np.zeros((len(positions), dim), dtype=np.float32)
+    for i, pos in enumerate(positions):
+        if pos is not None:
+            rows[i] = matrix[pos]
+    return rows
+
+def _as_documents(ids, documents, metadatas) -> List[Dict]:
+    """Dạng {id, text, metadata} như chunk JSON (cho BM25 / router)"""
+    return [
+        {"id": doc_id, "text": text or "", "metadata": metadata or {}}
+        for doc_id, text, metadata in zip(ids, documents, metadatas)
+    ]
+
+def load_collection_data(collection) -> CollectionData:
+    """Đọc toàn bộ embeddings, ids, metadata, documents từ một Chroma collection"""
+    data = collection.get(include=["embeddings", "metadatas", "documents"])
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    if embeddings.ndim != 2:
+        embeddings = embeddings.reshape(len(data["ids"]), -1)
+
+    return CollectionData(
+        ids=list(data["ids"]),
+        embeddings=np.ascontiguousarray(embeddings),
+        metadatas=list(data["metadatas"]),
+        documents=list(data["documents"])
+    )
+
+class ChromaEngine:
+    name = "chroma"
+    supports_global_search = False
+
+    def __init__(self, collections: Dict):
+        self.collections = collections
+
+    def query(
+        self,
+        coll_key: str,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        where: Optional[Dict] = None
+    ) -> List[List[SearchHit]]:
+        # Phase 1: chỉ ids/distances/metadata, text được đọc sau cho top-k
+        results = self.collections[coll_key].query(
+            query_embeddings=query_embeddings.tolist(),
+            n_results=n_results,
+            where=where,
+            include=["metadatas", "distances"]
+        )
+
+        hits = []
+        for q in range(len(query_embeddings)):
+            ids = results["ids"][q] if results and results["ids"] else []
+            hits.append([
+                SearchHit(
+                    doc_id,
+                    coll_key,
+                    metadata=results["metadatas"][q][i],
+                    distance=results["distances"][q][i]
+                )
+                for i, doc_id in enumerate(ids)
+            ])
+        return hits
+
+    def count(self, coll_key: str) -> int:
+        return self.collections[coll_key].count()
+
+    def fetch_documents(self, coll_key: str, ids: List[str]) -> Dict[str, str]:
+        """Phase 2: đọc text của các document còn lại sau merge (một lần get)"""
+        data = self.collections[coll_key].get(ids=list(ids), include=["documents"])
+        return dict(zip(data["ids"], data["documents"]))
+
+    def export_documents(self, coll_key: str) -> List[Dict]:
+        """Mọi document ({id, text, metadata}) đang được index của collection"""
+        data = self.collections[coll_key].get(include=["documents", "metadatas"])
+        return _as_documents(data["ids"], data["documents"], data["metadatas"])
+
+    def get_embeddings(self, coll_key: str, ids: List[str]) -> np.ndarray:
+        """Embeddings theo thứ tự ids (id không tồn tại -> vector 0)"""
+        data = self.collections[coll_key].get(ids=list(ids), include=["embeddings"])
+        found = np.asarray(data["embeddings"], dtype=np.float32)
+        if len(found) == 0:
+            return np.zeros((len(ids), 0), dtype=np.float32)
+        index = {doc_id: i for i, doc_id in enumerate(data["ids"])}
+        return _gather_rows(found, [index.get(i) for i in ids], found.shape[1])
+
+class FaissEngine:
+    """
+    In-process vector engine dùng FAISS
+
+    Collection nhỏ (<= FAISS_FLAT_MAX_DOCS) được tính điểm exact bằng
+    NumPy thẳng trên embeddings (view mmap khi dùng snapshot, không copy
+    vào IndexFlatIP của từng process); collection lớn dùng HNSW hoặc IVF
+    tùy FAISS_LARGE_INDEX (index riêng của process).
+    Query có where filter: filter được đánh giá trên columnar metadata
+    thành mask trước, rồi tính điểm exact bằng NumPy trên tập con thỏa filter.
+    """
+    name = "faiss"
+    supports_global_search = False
+
+    def __init__(self, collection_data: Dict[str, CollectionData]):
+        import faiss
+
+        self.faiss = faiss
+        self.data: Dict[str, CollectionData] = {}
+        self.indexes: Dict = {}
+
+        for coll_key, data in collection_data.items():
+            self.data[coll_key] = data
+            if len(data) > settings.FAISS_FLAT_MAX_DOCS:
+                self.indexes[coll_key] = self._build_index(data.embeddings)
+            print(f"✅ FAISS index {coll_key}: {len(data)} vectors")
+
+    def _build_index(self, embeddings: np.ndarray):
+        faiss = self.faiss
+        n_docs, dim = embeddings.shape
+
+        if settings.FAISS_LARGE_INDEX == "ivf":
+            nlist = max(1, int(4 * np.sqrt(n_docs)))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+            index.nprobe = min(nlist, settings.FAISS_IVF_NPROBE)
+        else:
+            index = faiss.IndexHNSWFlat(dim, settings.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = settings.FAISS_HNSW_EF_SEARCH
+
+        index.add(embeddings)
+        return index
+
+    def query(
+        self,
+        coll_key: str,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        where: Optional[Dict] = None
+    ) -> List[List[SearchHit]]:
+        data = self.data.get(coll_key)
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        if data is None or len(data) == 0:
+            return [[] for _ in range(len(query_embeddings))]
+
+        if where:
+            candidates = np.flatnonzero(data.columns.mask(where))
+            return self._query_exact(coll_key, data, query_embeddings, n_results, candidates)
+        if coll_key not in self.indexes:
+            return self._query_exact(coll_key, data, query_embeddings, n_results)
+
+        k = min(n_results, len(data))
+        scores, indices = self.indexes[coll_key].search(query_embeddings, k)
+        return [
+            self._to_hits(coll_key, data, indices[q], scores[q])
+            for q in range(len(query_embeddings))
+        ]
+
+    def _query_exact(
+        self,
+        coll_key: str,
+        data: CollectionData,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        candidates: Optional[np.ndarray] = None
+    ) -> List[List[SearchHit]]:
+        """Top-k exact bằng NumPy, trên cả collection hoặc tập candidates"""
+        if candidates is None:
+            # Tính thẳng trên embeddings (view mmap nếu có), không copy
+            scores = query_embeddings @ data.embeddings.T
+            candidates = np.arange(len(data))
+        else:
+            if len(candidates) == 0:
+                return [[] for _ in range(len(query_embeddings))]
+            scores = query_embeddings @ data.embeddings[candidates].T
+        k = min(n_results, len(candidates))
+
+        hits = []
+        for q in range(len(query_embeddings)):
+            top = np.argpartition(-scores[q], k - 1)[:k]
+            top = top[np.argsort(-scores[q][top])]
+            hits.append(self._to_hits(coll_key, data, candidates[top], scores[q][top]))
+        return hits
+
+    def count(self, coll_key: str) -> int:
+        return len(self.data[coll_key]) if coll_key in self.data else 0
+
+    def get_embeddings(self, coll_key: str, ids: List[str]) -> np.ndarray:
+        data = self.data[coll_key]
+        return _gather_rows(
+            data.embeddings,
+            [data.id_index.get(i) for i in ids],
+            data.embeddings.shape[1] if len(data) else 0
+        )
+
+    def export_documents(self, coll_key: str) -> List[Dict]:
+        data = self.data.get(coll_key)
+        if data is None:
+            return []
+        return _as_documents(data.ids, data.documents, data.metadatas)
+
+    def fetch_documents(self, coll_key: str, ids: List[str]) -> Dict[str, str]:
+        data = self.data[coll_key]
+        return {
+            doc_id: data.documents[data.id_index[doc_id]]
+            for doc_id in ids if doc_id in data.id_index
+        }
+
+    def _to_hits(
+        self,
+        coll_key: str,
+        data: CollectionData,
+        indices: np.ndarray,
+        scores: np.ndarray
+    ) -> List[SearchHit]:
+        distances = similarity_to_distance(scores)
+        return [
+            SearchHit(
+                data.ids[idx],
+                coll_key,
+                metadata=data.metadatas[idx],
+                distance=float(distances[i]),
+                text=data.documents[idx]
+            )
+            for i, idx in enumerate(indices)
+            if idx >= 0  # FAISS trả -1 khi không đủ kết quả
+        ]
+
+class UnifiedMatrixEngine:
+    """
+    Search toàn bộ collections trên MỘT ma trận float32
+
+    - matrix: (N, D) embeddings của mọi document, nối theo collection
+    - collection_ids: (N,) chỉ số collection của từng document
+    - doc_weights: (N,) trọng số collection (từ collections_config)
+
+    Một lần matmul + nhân trọng số + argpartition cho ra top-k toàn cục.
+    Tập con collections (theo intent) được áp dụng như mask, không tách
+    thành nhiều query riêng.
+    """
+    name = "matrix"
+    supports_global_search = True
+
+    def __init__(
+        self,
+        collection_data: Dict[str, CollectionData],
+        weights: Dict[str, float],
+        snapshot=None
+    ):
+        self.collection_keys: List[str] = []
+        self.ids: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.documents = []
+
+        # Snapshot chứa đúng các collections này (cùng thứ tự): dùng thẳng
+        # ma trận mmap và blob documents, không copy vào RAM của worker
+        shared = snapshot is not None and list(collection_data.keys()) == snapshot.keys()
+
+        blocks = []
+        collection_ids = []
+        for coll_key, data in collection_data.items():
+            if len(data) == 0:
+                continue
+
+            coll_index = len(self.collection_keys)
+            self.collection_keys.append(coll_key)
+            blocks.append(data.embeddings)
+            collection_ids.append(np.full(len(data), coll_index, dtype=np.int16))
+            self.ids.extend(data.ids)
+            self.metadatas.extend(data.metadatas)
+            if not shared:
+                self.documents.extend(data.documents)
+            print(f"✅ Matrix engine {coll_key}: {len(data)} vectors")
+
+        if shared:
+            self.matrix = snapshot.vectors
+            self.documents = snapshot.documents
+            self.collection_ids = (
+                np.concatenate(collection_ids) if collection_ids else np.zeros(0, dtype=np.int16)
+            )
+        elif blocks:
+            self.matrix = np.ascontiguousarray(np.vstack(blocks), dtype=np.float32)
+            self.collection_ids = np.concatenate(collection_ids)
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self.collection_ids = np.zeros(0, dtype=np.int16)
+
+        self.collection_weights = np.array(
+            [weights.get(k, 1.0) for k in self.collection_keys], dtype=np.float32
+        )
+        self.doc_weights = self.collection_weights[self.collection_ids]
+        self.columns = ColumnarMetadata(self.metadatas)
+        self.id_index = {
+            (self.collection_keys[c], doc_id): i
+            for i, (c, doc_id) in enumerate(zip(self.collection_ids, self.ids))
+        }
+
+    def count(self, coll_key: str) -> int:
+        if coll_key not in self.collection_keys:
+            return 0
+        return int(np.count_nonzero(
+            self.collection_ids == self.collection_keys.index(coll_key)
+        ))
+
+    def get_embeddings(self, coll_key: str, ids: List[str]) -> np.ndarray:
+        return _gather_rows(
+            self.matrix,
+            [self.id_index.get((coll_key, i)) for i in ids],
+            self.matrix.shape[1]
+        )
+
+    def export_documents(self, coll_key: str) -> List[Dict]:
+        if coll_key not in self.collection_keys:
+            return []
+        positions = np.flatnonzero(
+            self.collection_ids == self.collection_keys.index(coll_key)
+        )
+        return [
+            {
+                "id": self.ids[i],
+                "text": self.documents[i] or "",
+                "metadata": self.metadatas[i] or {}
+            }
+            for i in positions.tolist()
+        ]
+
+    def fetch_documents(self, coll_key: str, ids: List[str]) -> Dict[str, str]:
+        documents = {}
+        for doc_id in ids:
+            idx = self.id_index.get((coll_key, doc_id))
+            if idx is not None:
+                documents[doc_id] = self.documents[idx]
+        return documents
+
+    def _candidate_indices(
+        self,
+        collections: Optional[List[str]],
+        where: Optional[Dict]
+    ) -> Optional[np.ndarray]:
+        """Index các document thỏa collection subset + where (None = tất cả)"""
+        if collections is None and not where:
+            return None
+
+        mask = np.ones(len(self.ids), dtype=bool)
+        if collections is not None:
+            wanted = [
+                i for i, k in enumerate(self.collection_keys) if k in collections
+            ]
+            mask &= np.isin(self.collection_ids, wanted)
+        if where:
+            mask &= self.columns.mask(where)
+
+        return np.flatnonzero(mask)
+
+    def search_all(
+        self,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        collections: Optional[List[str]] = None,
+        where: Optional[Dict] = None
+    ) -> List[List[SearchHit]]:
+        """
+        Top-k toàn cục theo weighted_score, trả hit đã có collection/score
+
+        Matmul chạy trên một view (không copy) của dải hàng chứa mọi
+        candidate: mỗi collection nằm liền nhau trong ma trận nên subset
+        một collection chỉ chạm các page của collection đó (kể cả với
+        snapshot mmap). Document ngoài mask (collections + filter) trong dải
+        bị đặt điểm -inf.
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        n_queries = len(query_embeddings)
+
+        candidates = self._candidate_indices(collections, where)
+        if candidates is None:
+            lo, hi, n_candidates = 0, len(self.ids), len(self.ids)
+        elif len(candidates):
+            lo, hi, n_candidates = int(candidates[0]), int(candidates[-1]) + 1, len(candidates)
+        else:
+            lo = hi = n_candidates = 0
+
+        k = min(n_results, n_candidates)
+        if k <= 0:
+            return [[] for _ in range(n_queries)]
+
+        similarities = query_embeddings @ self.matrix[lo:hi].T       # (Q, hi - lo)
+        raw_scores = 1.0 - similarity_to_distance(similarities)
+        weighted = raw_scores * self.doc_weights[lo:hi]
+        if n_candidates < hi - lo:
+            excluded = np.ones(hi - lo, dtype=bool)
+            excluded[candidates - lo] = False
+            weighted[:, excluded] = -np.inf
+
+        top = np.argpartition(-weighted, k - 1, axis=1)[:, :k]
+        all_hits = []
+        for q in range(n_queries):
+            order = top[q][np.argsort(-weighted[q, top[q]])]
+            all_hits.append([
+                SearchHit(
+                    self.ids[lo + pos],
+                    self.collection_keys[self.collection_ids[lo + pos]],
+                    metadata=self.metadatas[lo + pos],
+                    distance=float(1.0 - raw_scores[q, pos]),
+                    text=self.documents[lo + pos],
+                    raw_score=float(raw_scores[q, pos]),
+                    weighted_score=float(weighted[q, pos])
+                )
+                for pos in order
+            ])
+        return all_hits
+
+    def query(
+        self,
+        coll_key: str,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        where: Optional[Dict] = None
+    ) -> List[List[SearchHit]]:
+        return self.search_all(query_embeddings, n_results, [coll_key], where)
+
+def _load_all(collections: Dict, snapshot=None) -> Dict[str, CollectionData]:
+    """Dữ liệu từng collection, ưu tiên snapshot mmap nếu có"""
+    collection_data = {}
+    for coll_key, collection in collections.items():
+        if snapshot is not None and coll_key in snapshot:
+            collection_data[coll_key] = snapshot.collection_data(coll_key)
+        elif collection is not None:
+            collection_data[coll_key] = load_collection_data(collection)
+    return collection_data
+
+def create_vector_engine(
+    engine_name: str,
+    collections: Dict,
+    weights: Optional[Dict[str, float]] = None,
+    snapshot=None
+):
+    """
+    Khởi tạo vector engine theo settings.VECTOR_ENGINE
+
+    snapshot (xem app/services/snapshot.py) chỉ dùng cho faiss / matrix;
+    khi đó collections có thể chứa None (không mở Chroma).
+    """
+    if engine_name == "matrix":
+        return UnifiedMatrixEngine(_load_all(collections, snapshot), weights or {}, snapshot)
+    if engine_name == "faiss":
+        try:
+            return FaissEngine(_load_all(collections, snapshot))
+        except ImportError as e:
+            if snapshot is not None:
+                print(f"⚠️ Không thể dùng FAISS ({e}), chuyển về matrix engine")
+                return UnifiedMatrixEngine(
+                    _load_all(collections, snapshot), weights or {}, snapshot
+                )
+            print(f"⚠️ Không thể dùng FAISS ({e}), chuyển về Chroma")
+    elif engine_name != "chroma":
+        print(f"⚠️ VECTOR_ENGINE không hợp lệ: {engine_name}, dùng Chroma")
+
+    return ChromaEngine(collections)
@@ -0,0 +1,48 @@
+from app.models.search_hit import SearchHit
+from app.services.adaptive_depth import expand_depths, initial_depth
+
+
+def _hits(collection, *scores):
+    return [SearchHit(f"{collection}-{i}", collection, weighted_score=s) for i, s in enumerate(scores)]
+
+
+def test_initial_depth_scales_with_weight():
+    assert initial_depth(1.0, 10, 0, min_depth=2, depth_factor=1.0) == 10
+    assert initial_depth(0.85, 10, 0, min_depth=2, depth_factor=1.0) == 9
+
+
+def test_initial_depth_bounds():
+    assert initial_depth(0.1, 5, 0, min_depth=2, depth_factor=1.0) == 2
+    assert initial_depth(1.0, 10, 4, min_depth=2, depth_factor=1.0) == 4
+
+
+def test_expands_collection_that_can_still_reach_top_k():
+    hits = {"products": _hits("products", 0.9, 0.8), "faqs": _hits("faqs", 0.3, 0.2)}
+    depths = {"products": 2, "faqs": 2}
+    expand = expand_depths(["products", "faqs"], hits, depths, n_results=3, sizes={})
+    # Điểm thứ 3 là 0.3: products (cận trên 0.8) còn vượt được, faqs (0.2) thì không
+    assert expand == ["products"]
+    assert depths == {"products": 4, "faqs": 2}
+
+
+def test_does_not_expand_exhausted_collection():
+    hits = {"products": _hits("products", 0.9), "faqs": _hits("faqs", 0.8, 0.7)}
+    depths = {"products": 2, "faqs": 2}
+    # products trả về ít hơn depth, faqs đã lấy hết theo size
+    expand = expand_depths(["products", "faqs"], hits, depths, n_results=5, sizes={"faqs": 2})
+    assert expand == []
+    assert depths == {"products": 2, "faqs": 2}
+
+
+def test_expansion_is_capped_by_collection_size():
+    hits = {"products": _hits("products", 0.9, 0.8, 0.7)}
+    depths = {"products": 3}
+    expand = expand_depths(["products"], hits, depths, n_results=10, sizes={"products": 5})
+    assert expand == ["products"]
+    assert depths["products"] == 5
+
+
+def test_only_completed_collections_are_expanded():
+    hits = {"products": _hits("products", 0.9, 0.8)}
+    depths = {"products": 2, "faqs": 2}
+    assert expand_depths([], hits, depths, n_results=5, sizes={}) == []
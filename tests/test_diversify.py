@@ -0,0 +1,54 @@
+import numpy as np
+
+from app.models.search_hit import SearchHit
+from app.services.diversify import mmr_diversify
+
+
+def _hit(doc_id, collection, score):
+    return SearchHit(doc_id, collection, weighted_score=score)
+
+
+def _unit(*rows):
+    embeddings = np.array(rows, dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_drops_near_duplicate_from_other_collection():
+    hits = [_hit("f1", "faqs", 0.9), _hit("g1", "order_guides", 0.85), _hit("p1", "policies", 0.5)]
+    embeddings = _unit([1, 0, 0], [1, 0.01, 0], [0, 1, 0])
+    selected = mmr_diversify(hits, embeddings, n_results=3)
+    assert [hit.id for hit in selected] == ["f1", "p1"]
+
+
+def test_keeps_near_duplicate_in_same_collection():
+    hits = [_hit("p1", "products", 0.9), _hit("p2", "products", 0.85)]
+    embeddings = _unit([1, 0], [1, 0.01])
+    selected = mmr_diversify(hits, embeddings, n_results=2)
+    assert [hit.id for hit in selected] == ["p1", "p2"]
+
+
+def test_mmr_prefers_diverse_hit():
+    hits = [
+        _hit("a", "products", 1.0),
+        _hit("b", "products", 0.95),
+        _hit("c", "products", 0.9),
+    ]
+    # b gần như trùng a, c khác hẳn: c được chọn trước b
+    embeddings = _unit([1, 0], [1, 0.05], [0, 1])
+    selected = mmr_diversify(hits, embeddings, n_results=2, lambda_=0.5)
+    assert [hit.id for hit in selected] == ["a", "c"]
+
+
+def test_respects_n_results_and_trivial_inputs():
+    hits = [_hit(str(i), "products", 1.0 - i / 10) for i in range(5)]
+    embeddings = np.eye(5, dtype=np.float32)
+    assert len(mmr_diversify(hits, embeddings, n_results=3)) == 3
+    assert mmr_diversify(hits[:1], embeddings[:1], n_results=3) == hits[:1]
+    assert mmr_diversify(hits, np.zeros((0, 0), dtype=np.float32), n_results=2) == hits[:2]
+
+
+def test_zero_embedding_is_never_a_duplicate():
+    hits = [_hit("f1", "faqs", 0.9), _hit("g1", "order_guides", 0.8)]
+    embeddings = np.array([[1, 0], [0, 0]], dtype=np.float32)
+    selected = mmr_diversify(hits, embeddings, n_results=2)
+    assert [hit.id for hit in selected] == ["f1", "g1"]
@@ -0,0 +1,37 @@
+from app.services.keyword_matcher import AhoCorasick, KeywordMatcher
+
+
+def _matcher():
+    return KeywordMatcher(
+        {"order_inquiry": ["đơn hàng", "hủy đơn"], "support": ["đổi trả"]},
+        ["áo thun", "áo", "cổ"],
+        ["Áo khoác"]
+    )
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick()
+    for pattern in ("he", "she", "hers"):
+        automaton.add(pattern, (pattern,))
+    automaton.build()
+    found = {(start, end, payload[0]) for start, end, payload in automaton.iter_matches("ushers")}
+    assert found == {(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")}
+
+
+def test_intents_and_product_terms():
+    match = _matcher().match("Tôi muốn hủy đơn hàng áo thun")
+    assert match.intent_scores == {"order_inquiry": 2, "support": 0}
+    assert match.product_terms == ["áo thun", "áo"]
+
+
+def test_query_without_diacritics():
+    match = _matcher().match("ao khoac doi tra")
+    assert match.intent_scores["support"] == 1
+    assert match.categories == ["Áo khoác"]
+    assert "áo" in match.product_terms
+
+
+def test_folded_keyword_must_be_whole_word():
+    # "co" (từ "cổ") không được khớp vào giữa "cotton"
+    assert "cổ" not in _matcher().match("vai cotton").product_terms
+    assert "cổ" in _matcher().match("ao co tron").product_terms
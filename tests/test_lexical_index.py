@@ -0,0 +1,48 @@
+from app.services.lexical_index import LexicalIndex
+
+
+DOCUMENTS = {
+    "products": [
+        {"id": "p1", "text": "Áo thun nam cotton", "metadata": {"price": 200000}},
+        {"id": "p2", "text": "Quần jean nữ ống rộng", "metadata": {"price": 450000}},
+        {"id": "p3", "text": "Áo khoác nam chống nước", "metadata": {"price": 650000}},
+    ],
+    "faqs": [
+        {"id": "f1", "text": "Chính sách đổi trả áo thun trong 30 ngày", "metadata": {}},
+    ],
+}
+
+
+def test_ranks_matching_documents_first():
+    hits = LexicalIndex(DOCUMENTS).search("áo thun nam", n_results=5)
+    assert hits[0].id == "p1"
+    assert all(hit.lexical_score > 0 for hit in hits)
+    assert "p2" not in {hit.id for hit in hits}
+
+
+def test_scores_are_sorted_descending():
+    hits = LexicalIndex(DOCUMENTS).search("áo thun", n_results=5)
+    scores = [hit.lexical_score for hit in hits]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_query_without_diacritics_uses_folded_postings():
+    hits = LexicalIndex(DOCUMENTS).search("quan jean", n_results=3)
+    assert [hit.id for hit in hits] == ["p2"]
+
+
+def test_collection_filter():
+    hits = LexicalIndex(DOCUMENTS).search("áo thun", n_results=5, collections=["faqs"])
+    assert [(hit.collection, hit.id) for hit in hits] == [("faqs", "f1")]
+
+
+def test_where_filter():
+    hits = LexicalIndex(DOCUMENTS).search(
+        "áo nam", n_results=5, collections=["products"], where={"price": {"$lt": 300000}}
+    )
+    assert [hit.id for hit in hits] == ["p1"]
+
+
+def test_no_match_and_empty_index():
+    assert LexicalIndex(DOCUMENTS).search("giày sneaker", n_results=5) == []
+    assert LexicalIndex({}).search("áo", n_results=5) == []
@@ -0,0 +1,90 @@
+import pytest
+
+from app.services.query_parser import parse_query, size_metadata_key
+
+
+def test_price_and_size():
+    parsed = parse_query("áo thun nam dưới 300k size XL")
+    assert parsed.max_price == 300_000
+    assert parsed.min_price is None
+    assert parsed.sizes == ["XL"]
+
+
+def test_co_with_accent_is_not_size():
+    parsed = parse_query("shop có 20 mẫu áo thun không")
+    assert parsed.sizes == []
+    assert not parsed.has_constraints
+
+
+def test_co_size_with_accent():
+    assert parse_query("giày cỡ 40").sizes == ["40"]
+
+
+def test_bare_number_without_unit_is_not_price():
+    parsed = parse_query("mua 2 áo từ 3 cái")
+    assert parsed.min_price is None
+    assert parsed.max_price is None
+
+
+def test_bare_number_with_price_context():
+    assert parse_query("giá dưới 300").max_price == 300_000
+    assert parse_query("dưới 300").max_price is None
+
+
+def test_price_range_with_trailing_unit():
+    parsed = parse_query("từ 200 đến 500 nghìn")
+    assert (parsed.min_price, parsed.max_price) == (200_000, 500_000)
+
+
+@pytest.mark.parametrize("query, sizes", [
+    ("size 38-40", ["38", "39", "40"]),
+    ("size 39 đến 41", ["39", "40", "41"]),
+    ("size s-xl", ["S", "M", "L", "XL"]),
+])
+def test_size_range(query, sizes):
+    parsed = parse_query(query)
+    assert parsed.sizes == sizes
+    assert parsed.min_price is None and parsed.max_price is None
+
+
+def test_size_range_with_price():
+    parsed = parse_query("giày size 38-40 giá dưới 500k")
+    assert parsed.sizes == ["38", "39", "40"]
+    assert parsed.max_price == 500_000
+    assert parsed.min_price is None
+
+
+@pytest.mark.parametrize("query, price", [
+    ("dưới 1tr5", 1_500_000),
+    ("dưới 1tr500", 1_500_000),
+    ("dưới 2 triệu", 2_000_000),
+    ("dưới 1.200.000đ", 1_200_000),
+])
+def test_compact_amounts(query, price):
+    assert parse_query(query).max_price == price
+
+
+def test_around_price():
+    parsed = parse_query("khoảng 300k")
+    assert parsed.min_price == pytest.approx(240_000)
+    assert parsed.max_price == pytest.approx(360_000)
+
+
+def test_to_filter_and_relaxed_filters():
+    parsed = parse_query("áo dưới 300k size M", categories=["Áo thun"])
+    assert parsed.to_filter() == {"$and": [
+        {"price": {"$lte": 300_000}},
+        {"category_name": "Áo thun"},
+        {size_metadata_key("M"): True},
+    ]}
+    assert parsed.relaxed_filters()[-1] is None
+
+
+def test_tien_alone_is_not_price_context():
+    parsed = parse_query("hoàn tiền mất từ 3-5 ngày")
+    assert parsed.min_price is None
+    assert parsed.max_price is None
+
+
+def test_tien_phrase_is_price_context():
+    assert parse_query("áo bao nhiêu tiền dưới 300").max_price == 300_000
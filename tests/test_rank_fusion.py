@@ -0,0 +1,42 @@
+import pytest
+
+from app.models.search_hit import SearchHit
+from app.services.rank_fusion import reciprocal_rank_fusion
+
+
+def _hit(doc_id, collection="faqs", lexical_score=None):
+    return SearchHit(doc_id, collection, lexical_score=lexical_score)
+
+
+def test_document_in_both_rankings_wins():
+    dense = [_hit("a"), _hit("b")]
+    lexical = [_hit("b", lexical_score=3.0), _hit("c", lexical_score=1.0)]
+    fused = reciprocal_rank_fusion(dense, lexical, n_results=3, rrf_k=60)
+
+    assert [hit.id for hit in fused] == ["b", "a", "c"]
+    assert fused[0].fused_score == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[0].lexical_score == 3.0
+
+
+def test_lexical_only_hit_is_included():
+    fused = reciprocal_rank_fusion([_hit("a")], [_hit("c", lexical_score=2.0)], n_results=5)
+    by_id = {hit.id: hit for hit in fused}
+    assert set(by_id) == {"a", "c"}
+    assert by_id["a"].lexical_score == 0.0
+    assert by_id["c"].fused_score == pytest.approx(1 / 61)
+
+
+def test_same_id_in_different_collections_is_not_merged():
+    fused = reciprocal_rank_fusion(
+        [_hit("1", "products")], [_hit("1", "faqs", lexical_score=1.0)], n_results=5
+    )
+    assert {(hit.collection, hit.id) for hit in fused} == {("products", "1"), ("faqs", "1")}
+
+
+def test_product_boost_and_n_results():
+    dense = [_hit("f1"), _hit("p1", "products")]
+    assert reciprocal_rank_fusion(dense, [], n_results=2)[0].id == "f1"
+
+    dense = [_hit("f1"), _hit("p1", "products")]
+    fused = reciprocal_rank_fusion(dense, [], n_results=1, boost_products=True)
+    assert [hit.id for hit in fused] == ["p1"]